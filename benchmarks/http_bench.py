@@ -0,0 +1,76 @@
+import asyncio
+import time
+import uuid
+from typing import Awaitable, Callable, Dict
+
+import httpx
+
+from benchmarks.stats import summarize
+
+__all__ = ("prepare_fixtures", "run_http_benchmarks")
+
+PASSWORD = "bench-password"
+
+
+async def prepare_fixtures(client: httpx.AsyncClient, posts: int) -> dict:
+    """Завести пользователя для замеров и наполнить ленту постами."""
+    suffix = uuid.uuid4().hex[:8]
+    user = {"username": f"bench_{suffix}", "email": f"bench{suffix}@example.com", "password": PASSWORD}
+    response = await client.post("/api/v1/signup", json=user)
+    response.raise_for_status()
+    response = await client.post("/api/v1/login", json={"username": user["username"], "password": PASSWORD})
+    response.raise_for_status()
+    access_token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+    for number in range(posts):
+        response = await client.post(
+            "/api/v1/posts/",
+            json={"title": f"bench post {number}", "description": "benchmark"},
+            headers=headers,
+        )
+        response.raise_for_status()
+    return {"username": user["username"], "headers": headers}
+
+
+async def _measure(send: Callable[[], Awaitable[httpx.Response]], concurrency: int, total: int) -> dict:
+    """Выполнить total запросов, держа concurrency запросов в работе одновременно."""
+    latencies = []
+    errors = 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            response = await send()
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+async def run_http_benchmarks(
+    client: httpx.AsyncClient,
+    fixtures: dict,
+    concurrency: int,
+    requests: int,
+    login_requests: int,
+) -> Dict[str, dict]:
+    # Вход упирается в bcrypt, поэтому для него отдельное, меньшее число запросов
+    login_body = {"username": fixtures["username"], "password": PASSWORD}
+    endpoints = {
+        "POST /api/v1/login": (lambda: client.post("/api/v1/login", json=login_body), login_requests),
+        "GET /api/v1/users/me": (lambda: client.get("/api/v1/users/me", headers=fixtures["headers"]), requests),
+        "GET /api/v1/posts/": (lambda: client.get("/api/v1/posts/"), requests),
+    }
+    results = {}
+    for name, (send, total) in endpoints.items():
+        # Прогрев: кэши и пулы соединений заполняются до замера
+        await _measure(send, concurrency, concurrency)
+        results[name] = await _measure(send, concurrency, total)
+        print(f"{name}: {results[name]}")
+    return results
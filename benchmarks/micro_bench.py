@@ -0,0 +1,68 @@
+import time
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict
+
+from benchmarks.stats import summarize
+from src.db import cache, db
+from src.models import User
+from src.services.auth import Auth
+from src.services.post import PostService
+from src.services.user import UserService
+
+__all__ = ("run_micro_benchmarks",)
+
+
+def _time_sync(func: Callable[[], object], iterations: int) -> dict:
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+async def _time_async(func: Callable[[], Awaitable[object]], iterations: int) -> dict:
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await func()
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+async def run_micro_benchmarks(iterations: int, post_iterations: int) -> Dict[str, dict]:
+    """Замеры отдельных функций; вызывать после startup приложения (нужны ключи и кэши)."""
+    results = {}
+    auth = Auth()
+    token = auth.encode_token("bench")
+
+    def decode_token_cold():
+        # Без кэша проверенных токенов — каждый раз полная проверка подписи
+        Auth.verified_tokens.clear()
+        auth.decode_token(token)
+
+    results["Auth.encode_token"] = _time_sync(lambda: auth.encode_token("bench"), iterations)
+    results["Auth.decode_token"] = _time_sync(decode_token_cold, iterations)
+    results["Auth.decode_token (cached)"] = _time_sync(lambda: auth.decode_token(token), iterations)
+
+    user = User(
+        id=1,
+        username="bench",
+        created_at=datetime.utcnow(),
+        uuid=str(uuid.uuid4()),
+        email="bench@example.com",
+        password="not-a-hash",
+    )
+    # Строку roles конструктор отбрасывает при валидации, поэтому присваиваем отдельно
+    user.roles = "{common_user,special_guest}"
+    user_service = UserService(cache=cache.cache, session=None)
+    results["UserService.get_user_dict"] = _time_sync(lambda: user_service.get_user_dict(user), iterations)
+
+    async with db.async_session() as session:
+        post_service = PostService(cache=cache.cache, session=session)
+        results["PostService.get_post_list"] = await _time_async(post_service.get_post_list, post_iterations)
+
+    for name, result in results.items():
+        print(f"{name}: {result}")
+    return results
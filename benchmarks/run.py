@@ -0,0 +1,158 @@
+"""Бенчмарки эндпоинтов и отдельных функций.
+
+Фикстуры пишут в базы, поэтому рабочие данные не трогаем: на сервере
+Postgres из переменных окружения приложения создается временная база
+bench_<hex> (пользователю нужно право CREATEDB) и удаляется после прогона,
+а для redis нужен отдельный redis-server — BENCH_REDIS_HOST (по умолчанию
+REDIS_HOST) и BENCH_REDIS_PORT. Без него запуск прерывается, базы 1-3
+этого сервера очищаются до и после замеров. Запуск:
+
+    BENCH_REDIS_PORT=6380 python -m benchmarks.run --output bench.json --baseline bench-main.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import uuid
+
+import asyncpg
+import httpx
+from redis import asyncio as aioredis
+
+from benchmarks.stats import compare
+from src.core import config
+
+BENCH_REDIS_HOST = os.getenv("BENCH_REDIS_HOST", config.REDIS_HOST)
+BENCH_REDIS_PORT = os.getenv("BENCH_REDIS_PORT")
+# Базы redis, которые использует приложение
+REDIS_DBS = (1, 2, 3)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Бенчмарки auth и posts эндпоинтов")
+    parser.add_argument("--output", default="bench.json", help="куда записать результаты в JSON")
+    parser.add_argument("--baseline", help="JSON с результатами для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.25, help="допустимое ухудшение, доля")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000, help="запросов на эндпоинт")
+    parser.add_argument("--login-requests", type=int, default=100, help="запросов к /login (bcrypt)")
+    parser.add_argument("--posts", type=int, default=50, help="сколько постов создать перед замером")
+    parser.add_argument("--iterations", type=int, default=5000, help="итераций микро-бенчмарков")
+    parser.add_argument("--post-iterations", type=int, default=500, help="итераций PostService.get_post_list")
+    return parser.parse_args()
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def isolate_databases() -> str:
+    """Направить приложение на временную базу Postgres и отдельный redis-server.
+
+    Движок и кэши создаются при импорте модулей приложения, поэтому адреса
+    подменяются до него. Возвращает имя временной базы.
+    """
+    if not BENCH_REDIS_PORT:
+        sys.exit("BENCH_REDIS_PORT is not set: benchmarks need a dedicated redis-server")
+    if (BENCH_REDIS_HOST, int(BENCH_REDIS_PORT)) == (config.REDIS_HOST, config.REDIS_PORT):
+        sys.exit("BENCH_REDIS_PORT points at the application redis-server, refusing to write fixtures into it")
+    config.REDIS_HOST, config.REDIS_PORT = BENCH_REDIS_HOST, int(BENCH_REDIS_PORT)
+    database = f"bench_{uuid.uuid4().hex[:12]}"
+    config.POSTGRES_DB = database
+    config.DATABASE_URL = f"{config.DATABASE_URL.rsplit('/', 1)[0]}/{database}"
+    config.ASYNC_DATABASE_URL = f"{config.ASYNC_DATABASE_URL.rsplit('/', 1)[0]}/{database}"
+    return database
+
+
+async def flush_redis():
+    for number in REDIS_DBS:
+        redis = aioredis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, db=number)
+        try:
+            await redis.flushdb()
+        finally:
+            await redis.close()
+
+
+async def run(args: argparse.Namespace, server_url: str, database: str) -> dict:
+    # Отладочные логи приложения искажают замеры
+    logging.disable(logging.INFO)
+    conn = await asyncpg.connect(server_url)
+    try:
+        await conn.execute(f'CREATE DATABASE "{database}"')
+    finally:
+        await conn.close()
+    try:
+        await flush_redis()
+        try:
+            return await measure(args)
+        finally:
+            await flush_redis()
+    finally:
+        conn = await asyncpg.connect(server_url)
+        try:
+            await conn.execute(f'DROP DATABASE IF EXISTS "{database}" WITH (FORCE)')
+        finally:
+            await conn.close()
+
+
+async def measure(args: argparse.Namespace) -> dict:
+    from benchmarks.http_bench import prepare_fixtures, run_http_benchmarks
+    from benchmarks.micro_bench import run_micro_benchmarks
+    from main import app
+
+    await app.router.startup()
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://benchmark") as client:
+            fixtures = await prepare_fixtures(client, posts=args.posts)
+            http = await run_http_benchmarks(
+                client,
+                fixtures,
+                concurrency=args.concurrency,
+                requests=args.requests,
+                login_requests=args.login_requests,
+            )
+        micro = await run_micro_benchmarks(args.iterations, args.post_iterations)
+    finally:
+        await app.router.shutdown()
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+        },
+        "http": http,
+        "micro": micro,
+    }
+
+
+def main():
+    args = parse_args()
+    # CREATE/DROP DATABASE выполняем из базы приложения: она точно существует
+    server_url = config.DATABASE_URL
+    database = isolate_databases()
+    results = asyncio.run(run(args, server_url, database))
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2, ensure_ascii=False)
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+from typing import Dict, List, Optional
+
+__all__ = ("percentile", "summarize", "compare")
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Перцентиль по методу ближайшего ранга; values должны быть отсортированы."""
+    if not values:
+        return 0.0
+    index = min(int(round(fraction * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def summarize(latencies: List[float], elapsed: Optional[float] = None, errors: int = 0) -> dict:
+    """Сводка по замерам в секундах: задержки в миллисекундах и запросы в секунду."""
+    values = sorted(latencies)
+    summary = {
+        "count": len(values),
+        "errors": errors,
+        "mean_ms": round(sum(values) / len(values) * 1000, 4) if values else 0.0,
+        "p50_ms": round(percentile(values, 0.50) * 1000, 4),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 4),
+    }
+    if elapsed:
+        summary["rps"] = round(len(values) / elapsed, 2)
+    return summary
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """Найти регрессии: p50/p99 выросли или rps упал больше чем на threshold."""
+    regressions = []
+    for section in ("http", "micro"):
+        for name, result in current.get(section, {}).items():
+            base: Dict[str, float] = baseline.get(section, {}).get(name)
+            if not base:
+                continue
+            for metric in ("p50_ms", "p99_ms"):
+                if base.get(metric) and result[metric] > base[metric] * (1 + threshold):
+                    regressions.append(f"{section}/{name}: {metric} {base[metric]} -> {result[metric]}")
+            if base.get("rps") and result.get("rps", 0) < base["rps"] * (1 - threshold):
+                regressions.append(f"{section}/{name}: rps {base['rps']} -> {result['rps']}")
+    return regressions
@@ -0,0 +1,206 @@
+"""Массовый импорт пользователей из CSV или JSONL.
+
+Пароли в файле уже захешированы (bcrypt в формате passlib), поэтому импорт
+не тратит время на хеширование. Записи читаются потоково и загружаются
+пачками: COPY во временную таблицу, затем INSERT ... ON CONFLICT DO NOTHING
+в "user", так что занятые имя или email просто пропускаются. Добавленные
+пользователи кладутся в кэш `user:{username}` одним пайплайном redis.
+После каждой пачки номер обработанной записи сохраняется в файл
+контрольной точки, и повторный запуск продолжает с него.
+
+    python import_users.py users.csv
+    python import_users.py users.jsonl --batch-size 5000 --checkpoint users.ckpt
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import asyncpg
+from passlib.context import CryptContext
+from redis import asyncio as aioredis
+
+# До импорта config: он настраивает логи на DEBUG и при импорте выводит
+# DATABASE_URL с паролем. Уже настроенный уровень INFO он не меняет.
+logging.basicConfig(level=logging.INFO)
+
+from src.core import config
+from src.services.user import EMAIL_RE, user_version_key
+
+logger = logging.getLogger(__name__)
+
+# Принимаем только хеши, которые сможет проверить сервис при логине
+hasher = CryptContext(schemes=['bcrypt'])
+
+DEFAULT_ROLES = 'common_user,special_guest'
+
+STAGING_TABLE = 'user_import'
+STAGING_COLUMNS = ('username', 'email', 'password', 'uuid', 'roles', 'created_at')
+
+CREATE_STAGING = f'''
+CREATE TEMP TABLE {STAGING_TABLE} (
+    username varchar NOT NULL,
+    email varchar NOT NULL,
+    password varchar NOT NULL,
+    uuid varchar NOT NULL,
+    roles varchar NOT NULL,
+    created_at timestamp NOT NULL
+)
+'''
+
+# Дубликаты внутри пачки и уже существующие пользователи отсекает уникальный индекс
+INSERT_FROM_STAGING = f'''
+INSERT INTO "user" (username, email, password, uuid, roles, created_at, is_totp_enabled, is_active)
+SELECT username, email, password, uuid, roles, created_at, false, true FROM {STAGING_TABLE}
+ON CONFLICT DO NOTHING
+RETURNING id, username, email, uuid, roles, created_at
+'''
+
+Record = Tuple[str, str, str, str, str, datetime]
+
+
+def read_rows(path: str, file_format: str) -> Iterator[Dict]:
+    with open(path, newline='', encoding='utf-8') as source:
+        if file_format == 'csv':
+            yield from csv.DictReader(source)
+            return
+        for line in source:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Битая строка считается отклоненной записью, а не обрывает импорт
+                    yield {}
+
+
+def to_record(row: Dict, default_roles: str) -> Optional[Record]:
+    """Строка файла в запись для COPY; None, если строка некорректна."""
+    try:
+        username = (row.get('username') or '').strip()
+        email = (row.get('email') or '').strip()
+        password = row.get('password') or ''
+        if not username or not re.search(EMAIL_RE, email) or not hasher.identify(password, required=False):
+            return None
+        roles = row.get('roles') or default_roles
+        if isinstance(roles, list):
+            roles = ','.join(roles)
+        created_at = row.get('created_at')
+        return (
+            username,
+            email,
+            password,
+            str(row.get('uuid') or uuid.uuid4()),
+            # Массив в формате Postgres, как его хранит колонка roles
+            '{' + roles.strip('{}') + '}',
+            datetime.fromisoformat(created_at) if created_at else datetime.utcnow(),
+        )
+    except (ValueError, TypeError, AttributeError):
+        # Нестроковые поля в JSONL, неверная дата и т.п.
+        return None
+
+
+def load_checkpoint(path: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    with open(path) as checkpoint:
+        return json.load(checkpoint)['processed']
+
+
+def save_checkpoint(path: str, processed: int):
+    # Пишем во временный файл и подменяем: прерванный запуск не оставит битую точку
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as checkpoint:
+        json.dump({'processed': processed}, checkpoint)
+    os.replace(tmp_path, path)
+
+
+async def import_batch(conn: asyncpg.Connection, records: List[Record]) -> List[asyncpg.Record]:
+    async with conn.transaction():
+        await conn.copy_records_to_table(STAGING_TABLE, records=records, columns=STAGING_COLUMNS)
+        inserted = await conn.fetch(INSERT_FROM_STAGING)
+        await conn.execute(f'TRUNCATE {STAGING_TABLE}')
+    return inserted
+
+
+async def warm_cache(redis: aioredis.Redis, inserted: List[asyncpg.Record]):
+    async with redis.pipeline(transaction=False) as pipe:
+        for user in inserted:
+            user_key = f"user:{user['username']}"
+            cached_user = {
+                'id': user['id'],
+                'username': user['username'],
+                'email': user['email'],
+                'uuid': user['uuid'],
+                'roles': user['roles'].strip('{}').split(','),
+                'created_at': user['created_at'].strftime('%Y-%m-%dT%H:%M:%S'),
+                'is_totp_enabled': False,
+                'is_active': True,
+            }
+            pipe.set(user_key, json.dumps(cached_user), ex=config.CACHE_EXPIRE_IN_SECONDS)
+            # Имя могло принадлежать пользователю, сменившему его: старые ETag не должны совпасть
+            pipe.incr(user_version_key(user_key))
+        await pipe.execute()
+
+
+async def run(args: argparse.Namespace):
+    checkpoint_path = args.checkpoint or f'{args.path}.checkpoint'
+    processed = resumed_from = load_checkpoint(checkpoint_path)
+    if processed:
+        logger.info('Resuming %s from record %s', args.path, processed)
+
+    conn = await asyncpg.connect(config.DATABASE_URL)
+    redis = None if args.no_cache else aioredis.Redis(
+        host=config.REDIS_HOST, port=config.REDIS_PORT, db=1, socket_timeout=config.REDIS_SOCKET_TIMEOUT_SECONDS,
+    )
+    total_inserted = total_rejected = 0
+    started = time.perf_counter()
+    try:
+        await conn.execute(CREATE_STAGING)
+        rows = islice(read_rows(args.path, args.format), processed, None)
+        while batch := list(islice(rows, args.batch_size)):
+            records = [record for record in (to_record(row, args.roles) for row in batch) if record is not None]
+            total_rejected += len(batch) - len(records)
+            inserted = await import_batch(conn, records) if records else []
+            if redis is not None and inserted:
+                await warm_cache(redis, inserted)
+            total_inserted += len(inserted)
+            processed += len(batch)
+            save_checkpoint(checkpoint_path, processed)
+            logger.info(
+                'Processed %s records: %s inserted, %s rejected, %.0f records/s',
+                processed, total_inserted, total_rejected, (processed - resumed_from) / (time.perf_counter() - started),
+            )
+    finally:
+        await conn.close()
+        if redis is not None:
+            await redis.close()
+    logger.info(
+        'Import finished: %s inserted, %s rejected, %s skipped as existing',
+        total_inserted, total_rejected, processed - resumed_from - total_inserted - total_rejected,
+    )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Импорт пользователей с готовыми bcrypt-хешами паролей')
+    parser.add_argument('path', help='CSV с заголовком или JSONL: username, email, password[, roles, uuid, created_at]')
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='по умолчанию определяется по расширению файла')
+    parser.add_argument('--batch-size', type=int, default=10000, help='записей в одном COPY')
+    parser.add_argument('--checkpoint', help='файл контрольной точки, по умолчанию <path>.checkpoint')
+    parser.add_argument('--roles', default=DEFAULT_ROLES, help='роли через запятую для записей без roles')
+    parser.add_argument('--no-cache', action='store_true', help='не прогревать кэш пользователей в redis')
+    args = parser.parse_args(argv)
+    if args.format is None:
+        args.format = 'jsonl' if args.path.endswith(('.jsonl', '.ndjson')) else 'csv'
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
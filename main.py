@@ -1,12 +1,16 @@
+import asyncio
 import logging
 
-import redis
 import uvicorn
 from fastapi import FastAPI
+from prometheus_client import make_asgi_app
 
-from src.api.v1.resources import posts, users
+from src.api.v1.resources import keys, posts, tokens, users
 from src.core import config
-from src.db import cache, redis_cache, db
+from src.core.middleware import PrometheusMiddleware
+from src.db import cache, db, local_cache, pubsub, redis_cache, redis_manager, refresh_token_registry
+from src.services import post, revocation, signing_keys, user
+from src.services.hashing import hashing_executor
 from src.models.post import Post # need it here to create tables
 from src.models.user import User, BlockedAccessToken # need it here to create tables
 
@@ -14,6 +18,9 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 logger.info(config.POSTGRES_HOST)
 
+# Фоновые задачи, которые нужно остановить при выключении сервера
+background_tasks = []
+
 
 app = FastAPI(
     # Конфигурируем название проекта. Оно будет отображаться в документации
@@ -25,51 +32,137 @@ app = FastAPI(
     # Адрес документации в формате OpenAPI
     openapi_url="/api/openapi.json",
 )
+# Время обработки запросов по маршрутам для Prometheus
+app.add_middleware(PrometheusMiddleware)
+if config.PROFILING_ENABLED:
+    from src.core.profiling import ProfilingMiddleware
+
+    app.add_middleware(
+        ProfilingMiddleware,
+        token=config.PROFILING_TOKEN,
+        sample_rate=config.PROFILING_SAMPLE_RATE,
+        interval=config.PROFILING_INTERVAL_SECONDS,
+        output_dir=config.PROFILING_OUTPUT_DIR,
+        max_files=config.PROFILING_MAX_FILES,
+    )
 
 
 @app.get("/")
-def root():
+async def root():
     return {"service": config.PROJECT_NAME, "version": config.VERSION}
 
 
 @app.on_event("startup")
-def startup():
+async def startup():
     """Подключаемся к базам при старте сервера"""
     logger.debug('Создаем базу!')
-    db.init_db()
+    await db.init_db()
+    hashing_executor.start()
 
+    # Все клиенты Redis работают через общие ограниченные пулы
+    redis_manager.redis_manager = redis_manager.RedisConnectionManager(
+        host=config.REDIS_HOST,
+        port=config.REDIS_PORT,
+        max_connections=config.REDIS_MAX_CONNECTIONS,
+        pool_timeout=config.REDIS_POOL_TIMEOUT_SECONDS,
+        socket_timeout=config.REDIS_SOCKET_TIMEOUT_SECONDS,
+        socket_connect_timeout=config.REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS,
+        health_check_interval=config.REDIS_HEALTH_CHECK_INTERVAL_SECONDS,
+    )
     cache.cache = redis_cache.CacheRedis(
-        cache_instance=redis.Redis(
-            host=config.REDIS_HOST, port=config.REDIS_PORT, max_connections=10, db=1
-        )
+        cache_instance=redis_manager.redis_manager.client(db=1),
+        key_prefixes={"user:": "user", "post": "posts"},
     )
     logger.debug(cache.cache.cache)
-    cache.cache.cache.ping()
+    await cache.cache.cache.ping()
     cache.blocked_access_tokens_cache = redis_cache.CacheRedis(
-        cache_instance=redis.Redis(
-            host=config.REDIS_HOST, port=config.REDIS_PORT, db=2, decode_responses=True
-        )
+        cache_instance=redis_manager.redis_manager.client(db=2, decode_responses=True),
+        name="blocked_tokens",
     )
     logger.debug(cache.blocked_access_tokens_cache.cache)
     cache.active_refresh_tokens_cache = redis_cache.CacheRedis(
-        cache_instance=redis.Redis(
-            host=config.REDIS_HOST, port=config.REDIS_PORT, db=3, decode_responses=True
-        )
+        cache_instance=redis_manager.redis_manager.client(db=3, decode_responses=True),
+        name="refresh_tokens",
     )
     logger.debug(cache.active_refresh_tokens_cache.cache)
+    refresh_token_registry.refresh_token_registry = refresh_token_registry.RefreshTokenRegistry(
+        redis=cache.active_refresh_tokens_cache.cache,
+        max_tokens_per_user=config.REFRESH_TOKENS_PER_USER_MAX,
+    )
+
+    if not config.JWT_ALGORITHM.startswith("HS"):
+        signing_keys.key_ring = signing_keys.KeyRing(
+            algorithm=config.JWT_ALGORITHM,
+            encryption_key=config.JWT_KEYS_ENCRYPTION_KEY,
+            rotation_interval=config.JWT_KEY_ROTATION_SECONDS,
+            activation_delay=config.JWT_KEY_ACTIVATION_DELAY_SECONDS,
+            # Старый ключ нужен, пока живут подписанные им refresh-токены
+            retention=config.REFRESH_TOKEN_EXPIRE_HOURS * 60 * 60,
+        )
+        await signing_keys.key_ring.ensure_signing_key()
+        background_tasks.append(asyncio.create_task(
+            signing_keys.run_key_rotation(signing_keys.key_ring, interval=config.JWT_KEYS_REFRESH_SECONDS)
+        ))
+
+    pubsub.pubsub_listener = pubsub.PubSubListener(redis=redis_manager.redis_manager.pubsub_client(db=1))
+    if config.USER_L1_CACHE_ENABLED:
+        local_cache.local_user_cache = local_cache.LocalCache(
+            name="user",
+            max_size=config.USER_L1_CACHE_SIZE,
+            ttl=config.USER_L1_CACHE_TTL_SECONDS,
+        )
+        pubsub.pubsub_listener.subscribe(
+            config.USER_CACHE_INVALIDATION_CHANNEL,
+            handler=user.forget_local_user,
+            on_resubscribe=local_cache.local_user_cache.clear,
+        )
+    if config.REVOKED_TOKENS_FILTER_ENABLED:
+        revocation.revoked_tokens_filter = revocation.RevokedTokensFilter(
+            capacity=config.REVOKED_TOKENS_FILTER_CAPACITY,
+            error_rate=config.REVOKED_TOKENS_FILTER_ERROR_RATE,
+        )
+        # Фильтр загружается из Postgres после каждой (пере)подписки на канал
+        pubsub.pubsub_listener.subscribe(
+            config.REVOKED_TOKENS_CHANNEL,
+            handler=revocation.revoked_tokens_filter.add,
+            on_resubscribe=revocation.revoked_tokens_filter.schedule_reload,
+        )
+    pubsub.pubsub_listener.start()
+
+    background_tasks.append(asyncio.create_task(revocation.run_revoked_tokens_compaction(
+        cache=cache.blocked_access_tokens_cache,
+        interval=config.REVOKED_TOKENS_PURGE_INTERVAL_SECONDS,
+        batch_size=config.REVOKED_TOKENS_PURGE_BATCH_SIZE,
+    )))
+    background_tasks.append(asyncio.create_task(post.run_post_views_flush(
+        cache=cache.cache,
+        interval=config.POST_VIEWS_FLUSH_INTERVAL_SECONDS,
+        batch_size=config.POST_VIEWS_FLUSH_BATCH_SIZE,
+    )))
 
 @app.on_event("shutdown")
-def shutdown():
+async def shutdown():
     """Отключаемся от баз при выключении сервера"""
     logger.debug('Сервер выключается. Отключаемся от баз.')
-    cache.cache.close()
-    cache.blocked_access_tokens_cache.cache.close()
-    cache.active_refresh_tokens_cache.cache.close()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await pubsub.pubsub_listener.stop()
+    await cache.cache.close()
+    await cache.blocked_access_tokens_cache.close()
+    await cache.active_refresh_tokens_cache.close()
+    await redis_manager.redis_manager.close()
+    await db.engine.dispose()
+    hashing_executor.shutdown()
 
 
 # Подключаем роутеры к серверу
 app.include_router(router=posts.router, prefix="/api/v1/posts")
 app.include_router(router=users.router, prefix="/api/v1")
+app.include_router(router=tokens.router, prefix="/api/v1/tokens")
+app.include_router(router=keys.router)
+# Метрики в формате Prometheus
+app.mount("/metrics", make_asgi_app())
 
 
 if __name__ == "__main__":
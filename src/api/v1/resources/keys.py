@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+
+from src.core import config
+from src.services.signing_keys import KeyRing, get_key_ring
+
+router = APIRouter()
+
+
+@router.get(path="/.well-known/jwks.json", summary="Открытые ключи для проверки токенов", tags=["auth"],)
+async def jwks(key_ring: KeyRing = Depends(get_key_ring)) -> JSONResponse:
+    # При подписи общим секретом (HS256) открытых ключей нет
+    keys = key_ring.jwks() if key_ring is not None else {"keys": []}
+    return JSONResponse(
+        content=keys,
+        headers={"Cache-Control": f"public, max-age={config.JWKS_CACHE_MAX_AGE_SECONDS}"},
+    )
@@ -1,40 +1,81 @@
 from http import HTTPStatus
-from typing import Optional
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Security
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 
-from src.api.v1.schemas import PostCreate, PostListResponse, PostModel
-from src.services import PostService, UserService, get_post_service, get_user_service
+from src.api.v1.responses import CachedJSONResponse, accepts_gzip, etag_matches, gzip_chunks, not_modified
+from src.api.v1.schemas import PostCreate, PostListResponse, PostModel, PostSearchResponse
+from src.api.v1.schemas.users import TokenPayload
+from src.core import config
+from src.services import PostService, UserService, feed_etag, get_post_service, get_token_claims, get_user_service
 
 router = APIRouter()
-security = HTTPBearer()
 
-@router.get(path="/", response_model=PostListResponse, summary="Список постов", tags=["posts"],)
-def post_list(post_service: PostService = Depends(get_post_service),) -> PostListResponse:
-    posts: dict = post_service.get_post_list()
-    if not posts:
-        # Если посты не найдены, отдаём 404 статус
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="posts not found")
-    return PostListResponse(**posts)
+@router.get(path="/", response_model=PostListResponse, response_class=CachedJSONResponse, summary="Список постов", tags=["posts"],)
+async def post_list(
+        after: Optional[str] = Query(default=None, description="Курсор из next_cursor предыдущей страницы"),
+        limit: int = Query(default=config.POSTS_PAGE_SIZE, ge=1, le=config.POSTS_PAGE_SIZE_MAX),
+        if_none_match: Optional[str] = Header(default=None),
+        post_service: PostService = Depends(get_post_service),) -> Response:
+    version = await post_service.get_feed_version()
+    etag = feed_etag(version, after=after, limit=limit)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    # Готовый JSON из кэша отдается без повторной валидации response_model
+    page: bytes = await post_service.get_post_list_response(after=after, limit=limit, version=version)
+    return CachedJSONResponse(content=page, headers={"ETag": etag})
 
 
-@router.get(path="/{post_id}",  response_model=PostModel, summary="Получить определенный пост", tags=["posts"],)
-def post_detail(post_id: int, post_service: PostService = Depends(get_post_service),) -> PostModel:
-    post: Optional[dict] = post_service.get_post_detail(item_id=post_id)
+@router.get(path="/search", response_model=PostSearchResponse, response_class=CachedJSONResponse, summary="Поиск постов", tags=["posts"],)
+async def post_search(
+        q: str = Query(..., min_length=1, max_length=200, description="Поисковый запрос"),
+        page: int = Query(default=1, ge=1, le=config.POSTS_SEARCH_MAX_PAGE),
+        limit: int = Query(default=config.POSTS_PAGE_SIZE, ge=1, le=config.POSTS_PAGE_SIZE_MAX),
+        post_service: PostService = Depends(get_post_service),) -> CachedJSONResponse:
+    results: bytes = await post_service.search_posts_response(query=q, page=page, limit=limit)
+    return CachedJSONResponse(content=results)
+
+
+# /search и /export объявлены до /{post_id}, иначе они разбирались бы как id поста
+@router.get(path="/export", response_class=StreamingResponse, summary="Выгрузить все посты в NDJSON", tags=["posts"],)
+async def post_export(
+        accept_encoding: Optional[str] = Header(default=None),
+        token_data: TokenPayload = Depends(get_token_claims),
+        post_service: PostService = Depends(get_post_service),) -> StreamingResponse:
+    body = post_service.export_posts()
+    headers = {"Vary": "Accept-Encoding"}
+    if accepts_gzip(accept_encoding):
+        body = gzip_chunks(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type="application/x-ndjson", headers=headers)
+
+
+@router.get(path="/{post_id}",  response_model=PostModel, response_class=CachedJSONResponse, summary="Получить определенный пост", tags=["posts"],)
+async def post_detail(post_id: int, post_service: PostService = Depends(get_post_service),) -> CachedJSONResponse:
+    post: Optional[bytes] = await post_service.view_post(item_id=post_id)
     if not post:
         # Если пост не найден, отдаём 404 статус
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="post not found")
-    return PostModel(**post)
+    return CachedJSONResponse(content=post)
 
 
 @router.post(path="/", response_model=PostModel, summary="Создать пост", tags=["posts"],)
-def post_create(post: PostCreate, 
-        credentials: HTTPAuthorizationCredentials = Security(security),
+async def post_create(post: PostCreate, 
+        token_data: TokenPayload = Depends(get_token_claims),
         post_service: PostService = Depends(get_post_service), 
         user_service: UserService = Depends(get_user_service),) -> PostModel:
-    access_token = credentials.credentials
-    user_service.check_token_if_blocked(access_token)
-    user_service.get_current_user(access_token)
-    post: dict = post_service.create_post(post=post)
+    await user_service.get_current_user(token_data)
+    post: dict = await post_service.create_post(post=post)
     return PostModel(**post)
+
+
+@router.post(path="/bulk", response_model=List[PostModel], summary="Создать несколько постов", tags=["posts"], status_code=201)
+async def post_bulk_create(
+        posts: List[PostCreate] = Body(..., min_items=1, max_items=config.POSTS_BULK_MAX_SIZE),
+        token_data: TokenPayload = Depends(get_token_claims),
+        post_service: PostService = Depends(get_post_service),
+        user_service: UserService = Depends(get_user_service),) -> List[PostModel]:
+    await user_service.get_current_user(token_data)
+    created: List[dict] = await post_service.create_posts(posts=posts)
+    return [PostModel(**post) for post in created]
@@ -0,0 +1,39 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Security, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from src.api.v1.schemas import IntrospectionRequest, IntrospectionResponse
+from src.core import config
+from src.services import UserService, get_user_service
+
+router = APIRouter()
+
+gateway_security = HTTPBearer(auto_error=False)
+
+
+def require_gateway(credentials: Optional[HTTPAuthorizationCredentials] = Security(gateway_security)):
+    """Интроспекция доступна только шлюзу, знающему INTROSPECTION_CLIENT_SECRET."""
+    secret = config.INTROSPECTION_CLIENT_SECRET
+    if not secret or credentials is None or not hmac.compare_digest(credentials.credentials.encode(), secret.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Not authenticated',
+            headers={'WWW-Authenticate': 'Bearer'},
+        )
+
+
+@router.post(
+    path="/introspect",
+    response_model=IntrospectionResponse,
+    summary="Проверить пачку access-токенов",
+    tags=["auth"],
+    dependencies=[Depends(require_gateway)],
+)
+async def introspect(
+    request: IntrospectionRequest,
+    user_service: UserService = Depends(get_user_service),
+) -> IntrospectionResponse:
+    results = await user_service.introspect_tokens(tokens=request.tokens)
+    return IntrospectionResponse(results=results)
@@ -1,59 +1,64 @@
 import logging
+from typing import Optional
 
-from fastapi import APIRouter, Depends, Security
-from fastapi.security import OAuth2PasswordBearer, HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import APIRouter, Depends, Header, Response, Security
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
+from src.api.v1.responses import CachedJSONResponse, etag_matches, not_modified
 from src.api.v1.schemas import UserCreate, UserModel, UserCreated, UserAuth, Tokens, Message, EditProfileResult
-from src.services import UserService, get_user_service
+from src.api.v1.schemas.users import TokenPayload
+from src.services import UserService, get_token_claims, get_user_service, user_etag
 
 router = APIRouter()
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-reuseable_oauth = OAuth2PasswordBearer(tokenUrl='/login', scheme_name='JWT')
 security = HTTPBearer()
 
 
 @router.post(path="/signup", response_model=UserCreated, summary="Зарегистрироваться", tags=["auth"], status_code=201)
-def signup(user: UserCreate, user_service: UserService = Depends(get_user_service),) -> UserCreated:
+async def signup(user: UserCreate, user_service: UserService = Depends(get_user_service),) -> UserCreated:
     logger.debug(user)
-    user = user_service.signup(user_details=user)
+    user = await user_service.signup(user_details=user)
     logger.debug(user)
     return UserCreated(username=user['username'], email=user['email'])
 
 
 @router.post(path="/login", response_model=Tokens, summary="Войти", tags=["auth"],)
-def login(user: UserAuth, user_service: UserService = Depends(get_user_service),) -> Tokens:
+async def login(user: UserAuth, user_service: UserService = Depends(get_user_service),) -> Tokens:
     logger.debug(user)
-    tokens = user_service.login(user_details=user)
+    tokens = await user_service.login(user_details=user)
     logger.debug(tokens)
     return Tokens(**tokens)
 
 
 @router.post(path="/refresh", response_model=Tokens, summary="Посмотреть информацию о себе", tags=["auth"],)
-def refresh(
+async def refresh(
     credentials: HTTPAuthorizationCredentials = Security(security), 
     user_service: UserService = Depends(get_user_service),
     ) -> Tokens:
     refresh_token = credentials.credentials
-    return user_service.refresh_tokens(refresh_token=refresh_token)
+    return await user_service.refresh_tokens(refresh_token=refresh_token)
 
 
-@router.get(path="/users/me", response_model=UserModel, summary="Посмотреть информацию о себе", tags=["auth"],)
-def get_me(token: str = Depends(reuseable_oauth), user_service: UserService = Depends(get_user_service),) -> UserModel:
-    user_service.check_token_if_blocked(token)
-    return user_service.get_current_user(token)
+@router.get(path="/users/me", response_model=UserModel, response_class=CachedJSONResponse, summary="Посмотреть информацию о себе", tags=["auth"],)
+async def get_me(
+        token_data: TokenPayload = Depends(get_token_claims),
+        if_none_match: Optional[str] = Header(default=None),
+        user_service: UserService = Depends(get_user_service),) -> Response:
+    etag = user_etag(token_data.sub, await user_service.get_user_version(token_data.sub))
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return CachedJSONResponse(content=await user_service.get_me_response(token_data), headers={"ETag": etag})
 
 
 @router.patch(path="/users/me", response_model=EditProfileResult, summary="Отредактировать свой профиль", tags=["auth"],)
-def edit_profile(
+async def edit_profile(
         user: UserCreated, 
-        credentials: HTTPAuthorizationCredentials = Security(security),
+        token_data: TokenPayload = Depends(get_token_claims),
         user_service: UserService = Depends(get_user_service),) -> EditProfileResult:
-    access_token = credentials.credentials
-    user_service.check_token_if_blocked(access_token)
-    edited_user, access_token = user_service.edit_user(access_token=access_token, new_user_details=user)
+    edited_user, access_token = await user_service.edit_user(token_data=token_data, new_user_details=user)
     return EditProfileResult(
         msg='Update is successful. Please use new access_token.',
         user=edited_user,
@@ -62,12 +67,16 @@ def edit_profile(
 
 
 @router.post(path="/logout", response_model=Message, summary="Выйти", tags=["auth"],)
-def logout(token: str = Depends(reuseable_oauth), user_service: UserService = Depends(get_user_service),) -> Message:
-    logger.debug(token)
-    return Message(msg=user_service.block_user_token(token))
+async def logout(
+        token_data: TokenPayload = Depends(get_token_claims),
+        user_service: UserService = Depends(get_user_service),) -> Message:
+    logger.debug(token_data)
+    return Message(msg=await user_service.block_user_token(token_data))
 
 
 @router.post(path="/logout_all", response_model=Message, summary="Выйти со всех устройств", tags=["auth"],)
-def logout_all(token: str = Depends(reuseable_oauth), user_service: UserService = Depends(get_user_service),) -> Message:
-    logger.debug(token)
-    return Message(msg=user_service.delete_refresh_tokens_from_cache(token))
\ No newline at end of file
+async def logout_all(
+        token_data: TokenPayload = Depends(get_token_claims),
+        user_service: UserService = Depends(get_user_service),) -> Message:
+    logger.debug(token_data)
+    return Message(msg=await user_service.delete_refresh_tokens_from_cache(token_data))
\ No newline at end of file
@@ -0,0 +1,57 @@
+import zlib
+from typing import Any, AsyncIterator, Optional
+
+from fastapi import Response, status
+from fastapi.responses import ORJSONResponse
+
+__all__ = ("CachedJSONResponse", "accepts_gzip", "etag_matches", "not_modified", "gzip_chunks")
+
+
+class CachedJSONResponse(ORJSONResponse):
+    """JSON-ответ через orjson; готовые bytes из кэша отдаются как есть."""
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return super().render(content)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Совпадает ли ETag с одним из перечисленных в If-None-Match (слабое сравнение)."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in (candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates)
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Разрешает ли Accept-Encoding gzip с ненулевым q; gzip без упоминания берет q у "*"."""
+    if not accept_encoding:
+        return False
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.strip().lower()] = weight
+    weight = weights.get("gzip", weights.get("x-gzip", weights.get("*", 0.0)))
+    return weight > 0
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Сжимать поток в gzip по мере поступления данных."""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    async for chunk in chunks:
+        if compressed := compressor.compress(chunk):
+            yield compressed
+    yield compressor.flush()
@@ -1,2 +1,3 @@
 from .posts import *
-from .users import *
\ No newline at end of file
+from .users import *
+from .tokens import *
\ No newline at end of file
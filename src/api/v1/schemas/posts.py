@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Optional
 
 from pydantic import BaseModel
 
@@ -6,6 +7,7 @@ __all__ = (
     "PostModel",
     "PostCreate",
     "PostListResponse",
+    "PostSearchResponse",
 )
 
 
@@ -20,8 +22,18 @@ class PostCreate(PostBase):
 
 class PostModel(PostBase):
     id: int
+    views: int = 0
     created_at: datetime
 
 
 class PostListResponse(BaseModel):
     posts: list[PostModel] = []
+    # Курсор следующей страницы, None — если это последняя страница
+    next_cursor: Optional[str] = None
+
+
+class PostSearchResponse(BaseModel):
+    posts: list[PostModel] = []
+    page: int
+    # Номер следующей страницы, None — если это последняя страница
+    next_page: Optional[int] = None
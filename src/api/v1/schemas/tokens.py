@@ -0,0 +1,26 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+from src.api.v1.schemas.users import TokenPayload
+from src.core import config
+
+__all__ = (
+    "IntrospectionRequest",
+    "IntrospectionResult",
+    "IntrospectionResponse",
+)
+
+
+class IntrospectionRequest(BaseModel):
+    tokens: List[str] = Field(..., min_items=1, max_items=config.INTROSPECTION_MAX_TOKENS)
+
+
+class IntrospectionResult(BaseModel):
+    active: bool
+    claims: Optional[TokenPayload] = None
+    detail: Optional[str] = None
+
+
+class IntrospectionResponse(BaseModel):
+    results: List[IntrospectionResult] = []
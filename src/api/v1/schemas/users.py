@@ -56,6 +56,7 @@ class TokenPayload(BaseModel):
     iat: datetime
     scope: str
     sub: str
+    jti: str
 
 
 class Message(BaseModel):
@@ -8,16 +8,105 @@ logger = logging.getLogger('__name__')
 VERSION: str = "1.0.0"
 
 # JWT SETTINGS
+# ES256 и EdDSA подписывают токены ротируемыми ключами (публикуются в JWKS),
+# HS256 — общим секретом JWT_SECRET_KEY
 JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "foo")
 JWT_ALGORITHM: str = os.getenv("JWT_ALGORITHM", "HS256")
+# Ключ шифрования закрытых ключей ES256/EdDSA в базе; для них обязателен
+JWT_KEYS_ENCRYPTION_KEY: str = os.getenv("JWT_KEYS_ENCRYPTION_KEY", "")
+# Переход с HS256 на ES256/EdDSA: до этого unix-времени принимаются и токены,
+# подписанные JWT_SECRET_KEY. Достаточно времени перехода + REFRESH_TOKEN_EXPIRE_HOURS
+JWT_HS256_ACCEPTED_UNTIL: int = int(os.getenv("JWT_HS256_ACCEPTED_UNTIL", 0))
+ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+REFRESH_TOKEN_EXPIRE_HOURS: int = 10
+JWT_KEY_ROTATION_SECONDS: int = int(os.getenv("JWT_KEY_ROTATION_SECONDS", 60 * 60 * 24))
+# Как часто воркеры перечитывают ключи из Redis
+JWT_KEYS_REFRESH_SECONDS: int = int(os.getenv("JWT_KEYS_REFRESH_SECONDS", 60))
+# Сколько сторонние сервисы могут кэшировать JWKS
+JWKS_CACHE_MAX_AGE_SECONDS: int = int(os.getenv("JWKS_CACHE_MAX_AGE_SECONDS", 60 * 5))
+# Новый ключ начинает подписывать, когда его точно видят все воркеры и кэши JWKS
+JWT_KEY_ACTIVATION_DELAY_SECONDS: int = JWKS_CACHE_MAX_AGE_SECONDS + 2 * JWT_KEYS_REFRESH_SECONDS
+
+# Настройки хэширования паролей (bcrypt в отдельном пуле процессов)
+HASHING_POOL_SIZE: int = int(os.getenv("HASHING_POOL_SIZE", os.cpu_count() or 1))
+# Сколько запросов может ждать свободный процесс, прежде чем отвечать 503
+HASHING_QUEUE_SIZE: int = int(os.getenv("HASHING_QUEUE_SIZE", 64))
 
 # Название проекта. Используется в Swagger-документации
 PROJECT_NAME: str = os.getenv("PROJECT_NAME", "ylab_hw_3")
 
+# Сколько недавно проверенных JWT держать в памяти воркера
+VERIFIED_TOKENS_CACHE_SIZE: int = int(os.getenv("VERIFIED_TOKENS_CACHE_SIZE", 10000))
+
+# Сколько токенов можно проверить одним запросом к /tokens/introspect
+INTROSPECTION_MAX_TOKENS: int = int(os.getenv("INTROSPECTION_MAX_TOKENS", 100))
+# Секрет шлюза для /tokens/introspect (Authorization: Bearer <секрет>). Пустой — эндпоинт закрыт
+INTROSPECTION_CLIENT_SECRET: str = os.getenv("INTROSPECTION_CLIENT_SECRET", "")
+
+# Профилирование отдельных запросов (pyinstrument). Выключено — middleware не подключается.
+# Запрос профилируется, если в заголовке X-Profile-Token передан PROFILING_TOKEN,
+# а также с вероятностью PROFILING_SAMPLE_RATE
+PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILING_TOKEN: str = os.getenv("PROFILING_TOKEN", "")
+PROFILING_SAMPLE_RATE: float = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+PROFILING_INTERVAL_SECONDS: float = float(os.getenv("PROFILING_INTERVAL_SECONDS", 0.001))
+PROFILING_OUTPUT_DIR: str = os.getenv("PROFILING_OUTPUT_DIR", "/tmp/profiles")
+# Сколько последних профилей хранить в PROFILING_OUTPUT_DIR, старые удаляются
+PROFILING_MAX_FILES: int = int(os.getenv("PROFILING_MAX_FILES", 1000))
+
 # Настройки Redis
 REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT: int = int(os.getenv("REDIS_PORT", 6379))
 CACHE_EXPIRE_IN_SECONDS: int = 60 * 5  # 5 минут
+# Пул соединений на каждую базу Redis: при исчерпании запрос ждет
+# свободное соединение до REDIS_POOL_TIMEOUT_SECONDS
+REDIS_MAX_CONNECTIONS: int = int(os.getenv("REDIS_MAX_CONNECTIONS", 20))
+REDIS_POOL_TIMEOUT_SECONDS: float = float(os.getenv("REDIS_POOL_TIMEOUT_SECONDS", 5))
+REDIS_SOCKET_TIMEOUT_SECONDS: float = float(os.getenv("REDIS_SOCKET_TIMEOUT_SECONDS", 5))
+REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS", 2))
+REDIS_HEALTH_CHECK_INTERVAL_SECONDS: int = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL_SECONDS", 30))
+
+# Кэш пользователей в памяти процесса перед Redis
+USER_L1_CACHE_ENABLED: bool = os.getenv("USER_L1_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+USER_L1_CACHE_SIZE: int = int(os.getenv("USER_L1_CACHE_SIZE", 10000))
+USER_L1_CACHE_TTL_SECONDS: int = int(os.getenv("USER_L1_CACHE_TTL_SECONDS", 30))
+# Канал Redis pub/sub, в который публикуются ключи измененных пользователей
+USER_CACHE_INVALIDATION_CHANNEL: str = "user-cache-invalidation"
+
+# Фильтр Блума отозванных access-токенов в памяти воркера
+REVOKED_TOKENS_FILTER_ENABLED: bool = os.getenv("REVOKED_TOKENS_FILTER_ENABLED", "true").lower() in ("1", "true", "yes")
+REVOKED_TOKENS_FILTER_CAPACITY: int = int(os.getenv("REVOKED_TOKENS_FILTER_CAPACITY", 1_000_000))
+REVOKED_TOKENS_FILTER_ERROR_RATE: float = float(os.getenv("REVOKED_TOKENS_FILTER_ERROR_RATE", 0.001))
+# Канал Redis pub/sub, в который публикуются jti отозванных токенов
+REVOKED_TOKENS_CHANNEL: str = "revoked-access-tokens"
+
+# Фоновое удаление истекших отозванных токенов
+REVOKED_TOKENS_PURGE_INTERVAL_SECONDS: int = int(os.getenv("REVOKED_TOKENS_PURGE_INTERVAL_SECONDS", 60 * 5))
+REVOKED_TOKENS_PURGE_BATCH_SIZE: int = int(os.getenv("REVOKED_TOKENS_PURGE_BATCH_SIZE", 1000))
+
+# Сколько активных refresh-токенов (сессий) хранится на пользователя
+REFRESH_TOKENS_PER_USER_MAX: int = int(os.getenv("REFRESH_TOKENS_PER_USER_MAX", 50))
+
+# Постраничный вывод постов
+POSTS_PAGE_SIZE: int = int(os.getenv("POSTS_PAGE_SIZE", 20))
+POSTS_PAGE_SIZE_MAX: int = int(os.getenv("POSTS_PAGE_SIZE_MAX", 100))
+# Кэш постов: TTL случайно отклоняется на долю POSTS_CACHE_TTL_JITTER, чтобы
+# ключи не истекали разом; отсутствующие id кэшируются на короткое время
+POSTS_CACHE_TTL_JITTER: float = float(os.getenv("POSTS_CACHE_TTL_JITTER", 0.1))
+POSTS_NEGATIVE_CACHE_TTL_SECONDS: int = int(os.getenv("POSTS_NEGATIVE_CACHE_TTL_SECONDS", 30))
+# Сколько живет готовый ответ страницы списка постов
+POSTS_PAGE_CACHE_TTL_SECONDS: int = int(os.getenv("POSTS_PAGE_CACHE_TTL_SECONDS", 60))
+# Поиск постов: страницы результатов кэшируются в Redis до изменения ленты
+POSTS_SEARCH_CACHE_TTL_SECONDS: int = int(os.getenv("POSTS_SEARCH_CACHE_TTL_SECONDS", 60))
+POSTS_SEARCH_MAX_PAGE: int = int(os.getenv("POSTS_SEARCH_MAX_PAGE", 50))
+# Сколько строк за раз читать из серверного курсора при выгрузке постов
+POSTS_EXPORT_BATCH_SIZE: int = int(os.getenv("POSTS_EXPORT_BATCH_SIZE", 1000))
+# Сколько постов можно создать одним запросом к /posts/bulk
+POSTS_BULK_MAX_SIZE: int = int(os.getenv("POSTS_BULK_MAX_SIZE", 1000))
+
+# Просмотры постов копятся в Redis и раз в интервал переносятся в Postgres
+POST_VIEWS_FLUSH_INTERVAL_SECONDS: int = int(os.getenv("POST_VIEWS_FLUSH_INTERVAL_SECONDS", 10))
+POST_VIEWS_FLUSH_BATCH_SIZE: int = int(os.getenv("POST_VIEWS_FLUSH_BATCH_SIZE", 5000))
 
 # Настройки Postgres
 POSTGRES_HOST: str = os.getenv("POSTGRES_HOST", "localhost")
@@ -27,6 +116,19 @@ POSTGRES_USER: str = os.getenv("POSTGRES_USER", "ylab_hw")
 POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD", "ylab_hw")
 
 DATABASE_URL: str = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+# Тот же адрес для асинхронного драйвера asyncpg
+ASYNC_DATABASE_URL: str = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+# Пул соединений с Postgres на один воркер: не больше
+# DB_POOL_SIZE + DB_MAX_OVERFLOW соединений одновременно
+DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT_SECONDS: float = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", 10))
+DB_POOL_RECYCLE_SECONDS: int = int(os.getenv("DB_POOL_RECYCLE_SECONDS", 60 * 30))
+DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# statement_timeout Postgres для соединений приложения, 0 — без ограничения
+DB_STATEMENT_TIMEOUT_MS: int = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 5000))
+# Логировать все SQL-запросы (только для отладки)
+DB_ECHO: bool = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")
 logger.debug('DATABASE_URL:')
 logger.debug(DATABASE_URL)
 # Корень проекта
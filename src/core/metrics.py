@@ -0,0 +1,136 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+__all__ = (
+    "HASHING_QUEUE_DEPTH",
+    "HASHING_IN_PROGRESS",
+    "HASHING_LATENCY",
+    "HASHING_REJECTED",
+    "LOCAL_CACHE_HITS",
+    "LOCAL_CACHE_MISSES",
+    "LOCAL_CACHE_SIZE",
+    "REVOCATION_FILTER_CHECKS",
+    "REVOKED_TOKENS_PURGED",
+    "REDIS_POOL_CONNECTIONS",
+    "REDIS_POOL_MAX_CONNECTIONS",
+    "DB_POOL_CHECKOUT_WAIT",
+    "DB_POOL_CONNECTIONS",
+    "DB_QUERY_LATENCY",
+    "HTTP_REQUEST_LATENCY",
+    "HTTP_REQUESTS_IN_PROGRESS",
+    "CACHE_REQUESTS",
+    "CACHE_LATENCY",
+    "POST_VIEWS_FLUSHED",
+)
+
+
+# Хэширование паролей
+HASHING_QUEUE_DEPTH = Gauge(
+    "hashing_queue_depth",
+    "Операции bcrypt, ожидающие свободный процесс",
+)
+HASHING_IN_PROGRESS = Gauge(
+    "hashing_in_progress",
+    "Операции bcrypt, выполняющиеся в пуле процессов",
+)
+HASHING_LATENCY = Histogram(
+    "hashing_latency_seconds",
+    "Время операции bcrypt с учетом ожидания в очереди",
+    ["operation"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+HASHING_REJECTED = Counter(
+    "hashing_rejected_total",
+    "Операции bcrypt, отклоненные из-за переполненной очереди",
+    ["operation"],
+)
+
+# Кэш в памяти процесса
+LOCAL_CACHE_HITS = Counter(
+    "local_cache_hits_total",
+    "Попадания в кэш в памяти процесса",
+    ["cache"],
+)
+LOCAL_CACHE_MISSES = Counter(
+    "local_cache_misses_total",
+    "Промахи кэша в памяти процесса",
+    ["cache"],
+)
+LOCAL_CACHE_SIZE = Gauge(
+    "local_cache_size",
+    "Число записей в кэше в памяти процесса",
+    ["cache"],
+)
+
+# Фильтр отозванных токенов
+REVOCATION_FILTER_CHECKS = Counter(
+    "revocation_filter_checks_total",
+    "Проверки jti в фильтре отозванных токенов",
+    ["result"],
+)
+REVOKED_TOKENS_PURGED = Counter(
+    "revoked_tokens_purged_total",
+    "Истекшие отозванные токены, удаленные из Postgres",
+)
+
+
+# Пулы соединений Redis
+REDIS_POOL_CONNECTIONS = Gauge(
+    "redis_pool_connections",
+    "Соединения в пуле Redis: созданные и занятые",
+    ["pool", "state"],
+)
+REDIS_POOL_MAX_CONNECTIONS = Gauge(
+    "redis_pool_max_connections",
+    "Максимальное число соединений в пуле Redis",
+    ["pool"],
+)
+
+# Пул соединений с Postgres
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Время получения соединения из пула Postgres",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10),
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Соединения в пуле Postgres: занятые, свободные и сверх pool_size",
+    ["state"],
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_latency_seconds",
+    "Время выполнения SQL-запроса",
+    ["operation", "table"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+
+# HTTP-запросы
+HTTP_REQUEST_LATENCY = Histogram(
+    "http_request_latency_seconds",
+    "Время обработки HTTP-запроса",
+    ["method", "route", "status"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP-запросы, обрабатываемые прямо сейчас",
+    ["method", "route"],
+)
+
+# Кэши в Redis
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Обращения к кэшу в Redis; для чтений result — hit или miss",
+    ["cache", "operation", "result"],
+)
+CACHE_LATENCY = Histogram(
+    "cache_latency_seconds",
+    "Время обращения к кэшу в Redis",
+    ["cache", "operation"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+
+# Просмотры постов
+POST_VIEWS_FLUSHED = Counter(
+    "post_views_flushed_total",
+    "Посты, чьи накопленные просмотры перенесены в Postgres",
+)
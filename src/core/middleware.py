@@ -0,0 +1,48 @@
+import time
+
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.core.metrics import HTTP_REQUEST_LATENCY, HTTP_REQUESTS_IN_PROGRESS
+
+__all__ = ("PrometheusMiddleware",)
+
+
+def _route_path(scope: Scope) -> str:
+    """Шаблон пути маршрута (/api/v1/posts/{post_id}), чтобы не плодить метки по id."""
+    for route in scope["app"].routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class PrometheusMiddleware:
+    """Время обработки и число одновременных HTTP-запросов по маршрутам."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = _route_path(scope)
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_LATENCY.labels(method, route, str(status_code)).observe(time.perf_counter() - started)
+            in_progress.dec()
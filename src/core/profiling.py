@@ -0,0 +1,167 @@
+import asyncio
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import time
+import uuid
+from contextlib import suppress
+from typing import Dict, List, Optional
+
+from pyinstrument import Profiler
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+__all__ = ("ProfilingMiddleware", "split_by_category")
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile-token"
+# Путь запроса попадает в имя файла, длинный обрезаем
+MAX_PATH_LENGTH = 64
+
+# Категории по пути файла кадра; время кадра относится к самой вложенной
+# подходящей категории. Ожидание bcrypt в пуле процессов видно как await
+# внутри src/services/hashing.py.
+CATEGORIES = (
+    ("bcrypt", ("passlib", "bcrypt", "src/services/hashing.py")),
+    ("jwt", ("/jwt/", "cryptography")),
+    ("redis", ("/redis/",)),
+    ("sql", ("sqlalchemy", "sqlmodel", "asyncpg")),
+    ("serialization", ("pydantic", "fastapi/encoders.py", "/json/", "orjson")),
+)
+
+
+def _category(file_path: Optional[str]) -> Optional[str]:
+    if not file_path:
+        return None
+    file_path = file_path.replace(os.sep, "/")
+    for name, patterns in CATEGORIES:
+        if any(pattern in file_path for pattern in patterns):
+            return name
+    return None
+
+
+def _frame_time(frame) -> float:
+    # До pyinstrument 4.6 time — метод, в новых версиях — атрибут
+    return frame.time() if callable(frame.time) else frame.time
+
+
+def split_by_category(root_frame) -> Dict[str, float]:
+    """Разложить время дерева вызовов pyinstrument по категориям, в секундах."""
+    totals = {name: 0.0 for name, _ in CATEGORIES}
+    totals["other"] = 0.0
+    stack = [(root_frame, "other")]
+    while stack:
+        frame, inherited = stack.pop()
+        if frame is None:
+            continue
+        category = _category(frame.file_path) or inherited
+        # Собственное время кадра: self_time есть не во всех версиях pyinstrument
+        totals[category] += _frame_time(frame) - sum(_frame_time(child) for child in frame.children)
+        stack.extend((child, category) for child in frame.children)
+    return {name: round(seconds, 6) for name, seconds in totals.items()}
+
+
+class ProfilingMiddleware:
+    """Сэмплирующий профилировщик для отдельных запросов.
+
+    Профилируется запрос с заголовком X-Profile-Token, совпадающим с
+    token, и доля sample_rate остальных запросов. Дерево вызовов
+    сохраняется в output_dir в HTML, разбивка по категориям — в JSON;
+    хранятся только max_files последних профилей.
+    Запросу с заголовком разбивка возвращается в заголовке Server-Timing.
+    Middleware подключается только при включенном профилировании, иначе
+    накладных расходов нет.
+    """
+
+    def __init__(self, app: ASGIApp, token: str, sample_rate: float, interval: float, output_dir: str, max_files: int):
+        self.app = app
+        self.token = token.encode()
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.output_dir = output_dir
+        self.max_files = max_files
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _requested(self, scope: Scope) -> bool:
+        if not self.token:
+            return False
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return hmac.compare_digest(value, self.token)
+        return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        requested = self._requested(scope)
+        if not requested and not (self.sample_rate and random.random() < self.sample_rate):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        profiler = Profiler(interval=self.interval, async_mode="enabled")
+        categories: Optional[Dict[str, float]] = None
+
+        def finish() -> Dict[str, float]:
+            nonlocal categories
+            if categories is None:
+                profiler.stop()
+                categories = split_by_category(profiler.last_session.root_frame())
+            return categories
+
+        # Ответ запросу с заголовком придерживаем, чтобы добавить в него Server-Timing
+        held: List[Message] = []
+
+        async def send_wrapper(message: Message):
+            if not requested:
+                await send(message)
+                return
+            held.append(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                timings = finish()
+                start = held[0]
+                start["headers"] = list(start.get("headers", [])) + [
+                    (b"x-profile-id", profile_id.encode()),
+                    (b"server-timing", _server_timing(timings).encode()),
+                ]
+                for held_message in held:
+                    await send(held_message)
+                held.clear()
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finish()
+            loop = asyncio.get_running_loop()
+            loop.run_in_executor(None, self._save, profiler, profile_id, scope, categories)
+
+    def _save(self, profiler: Profiler, profile_id: str, scope: Scope, categories: Dict[str, float]):
+        try:
+            path = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_")[:MAX_PATH_LENGTH] or "root"
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{scope['method']}-{path}-{profile_id}"
+            with open(os.path.join(self.output_dir, f"{name}.html"), "w") as output:
+                output.write(profiler.output_html())
+            with open(os.path.join(self.output_dir, f"{name}.json"), "w") as output:
+                json.dump({"method": scope["method"], "path": scope["path"], "seconds": categories}, output)
+            self._prune()
+        except Exception:
+            logger.exception('Failed to save profile %s', profile_id)
+
+    def _prune(self):
+        # Имена начинаются с времени сохранения, поэтому сортировка по имени — по возрасту
+        names = sorted(name[:-len(".html")] for name in os.listdir(self.output_dir) if name.endswith(".html"))
+        for name in names[:max(len(names) - self.max_files, 0)]:
+            for suffix in (".html", ".json"):
+                # Тот же профиль может удалять параллельное сохранение
+                with suppress(FileNotFoundError):
+                    os.remove(os.path.join(self.output_dir, f"{name}{suffix}"))
+
+
+def _server_timing(categories: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in categories.items())
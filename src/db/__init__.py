@@ -1,3 +1,8 @@
 from .cache import *
 from .db import *
 from .redis_cache import *
+from .redis_manager import *
+from .local_cache import *
+from .pubsub import *
+from .refresh_token_registry import *
+from .single_flight import *
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Optional, Union
+from typing import Dict, List, Optional, Union
 
 __all__ = (
     "AbstractCache",
@@ -16,11 +16,15 @@ class AbstractCache(ABC):
         self.cache = cache_instance
 
     @abstractmethod
-    def get(self, key: str):
+    async def get(self, key: str):
         pass
 
     @abstractmethod
-    def set(
+    async def get_many(self, keys: List[str]) -> list:
+        pass
+
+    @abstractmethod
+    async def set(
         self,
         key: str,
         value: Union[bytes, str],
@@ -29,7 +33,15 @@ class AbstractCache(ABC):
         pass
 
     @abstractmethod
-    def close(self):
+    async def set_many(
+        self,
+        mapping: Dict[str, Union[bytes, str]],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ):
+        pass
+
+    @abstractmethod
+    async def close(self):
         pass
 
 
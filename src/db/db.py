@@ -1,17 +1,87 @@
-from sqlmodel import SQLModel, Session, create_engine
+import re
+import time
+from functools import lru_cache
+from typing import Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.core import config
+from src.core.metrics import DB_POOL_CHECKOUT_WAIT, DB_POOL_CONNECTIONS, DB_QUERY_LATENCY
 
 __all__ = ("get_session", "init_db")
 
 
-engine = create_engine(config.DATABASE_URL, echo=True)
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, замеряющий время ожидания соединения (включая открытие нового)."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+
+connect_args = {}
+if config.DB_STATEMENT_TIMEOUT_MS:
+    connect_args["server_settings"] = {"statement_timeout": str(config.DB_STATEMENT_TIMEOUT_MS)}
+
+engine = create_async_engine(
+    config.ASYNC_DATABASE_URL,
+    echo=config.DB_ECHO,
+    poolclass=TimedQueuePool,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT_SECONDS,
+    pool_recycle=config.DB_POOL_RECYCLE_SECONDS,
+    pool_pre_ping=config.DB_POOL_PRE_PING,
+    connect_args=connect_args,
+)
+async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+# Пул пересоздается при dispose(), поэтому каждый раз берем текущий
+DB_POOL_CONNECTIONS.labels("in_use").set_function(lambda: engine.sync_engine.pool.checkedout())
+DB_POOL_CONNECTIONS.labels("idle").set_function(lambda: engine.sync_engine.pool.checkedin())
+DB_POOL_CONNECTIONS.labels("overflow").set_function(lambda: max(engine.sync_engine.pool.overflow(), 0))
+
+TABLE_RE = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+"?(\w+)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def _statement_labels(statement: str) -> Tuple[str, str]:
+    """Тип запроса и первая таблица в нем — метки для DB_QUERY_LATENCY."""
+    operation = (statement.split(None, 1) or [""])[0].upper()
+    table = TABLE_RE.search(statement)
+    return operation, table.group(1).lower() if table else ""
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _observe_query(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    DB_QUERY_LATENCY.labels(*_statement_labels(statement)).observe(time.perf_counter() - started)
+
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _drop_query_timer(context):
+    if context.connection is not None and context.connection.info.get("query_started"):
+        context.connection.info["query_started"].pop()
 
 
-def init_db():
-    SQLModel.metadata.create_all(engine)
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
 
 
-def get_session():
-    with Session(engine) as session:
+async def get_session():
+    async with async_session() as session:
         yield session
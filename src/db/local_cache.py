@@ -0,0 +1,60 @@
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from src.core.metrics import LOCAL_CACHE_HITS, LOCAL_CACHE_MISSES, LOCAL_CACHE_SIZE
+
+__all__ = ("LocalCache", "get_local_user_cache")
+
+
+class LocalCache:
+    """Кэш в памяти процесса: LRU с ограниченным числом записей и TTL.
+
+    Не потокобезопасен — рассчитан на использование из одного event loop.
+    """
+
+    def __init__(self, name: str, max_size: int, ttl: float):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            LOCAL_CACHE_MISSES.labels(self.name).inc()
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        LOCAL_CACHE_HITS.labels(self.name).inc()
+        return item[1]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+        LOCAL_CACHE_SIZE.labels(self.name).set(len(self._data))
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+        LOCAL_CACHE_SIZE.labels(self.name).set(len(self._data))
+
+    def clear(self):
+        self._data.clear()
+        LOCAL_CACHE_SIZE.labels(self.name).set(0)
+
+
+local_user_cache: Optional[LocalCache] = None
+
+
+def get_local_user_cache() -> Optional[LocalCache]:
+    return local_user_cache
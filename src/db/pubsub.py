@@ -0,0 +1,75 @@
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+__all__ = ("PubSubListener", "get_pubsub_listener")
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+RECONNECT_DELAY_SECONDS = 1
+
+
+class PubSubListener:
+    """Фоновая подписка на каналы Redis pub/sub.
+
+    Обработчики вызываются с данными сообщения в виде строки. Пока
+    подписка была разорвана, сообщения могли потеряться, поэтому после
+    каждой (пере)подписки вызываются обработчики on_resubscribe.
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self._handlers: Dict[str, Callable[[str], None]] = {}
+        self._resubscribe_handlers: List[Callable[[], None]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(
+        self,
+        channel: str,
+        handler: Callable[[str], None],
+        on_resubscribe: Optional[Callable[[], None]] = None,
+    ):
+        self._handlers[channel] = handler
+        if on_resubscribe is not None:
+            self._resubscribe_handlers.append(on_resubscribe)
+
+    def start(self):
+        if self._task is None and self._handlers:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(*self._handlers)
+                for on_resubscribe in self._resubscribe_handlers:
+                    on_resubscribe()
+                async for message in pubsub.listen():
+                    channel, data = message['channel'], message['data']
+                    if isinstance(channel, bytes):
+                        channel, data = channel.decode(), data.decode()
+                    self._handlers[channel](data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning('Redis pub/sub connection lost: %s', e)
+                await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+            finally:
+                await pubsub.reset()
+
+
+pubsub_listener: Optional[PubSubListener] = None
+
+
+def get_pubsub_listener() -> Optional[PubSubListener]:
+    return pubsub_listener
@@ -1,22 +1,80 @@
-from typing import NoReturn, Optional, Union
+import time
+from typing import Dict, List, NoReturn, Optional, Union
 
 from src.core import config
+from src.core.metrics import CACHE_LATENCY, CACHE_REQUESTS
 from src.db import AbstractCache
 
 __all__ = ("CacheRedis",)
 
 
 class CacheRedis(AbstractCache):
-    def get(self, key: str) -> Optional[dict]:
-        return self.cache.get(name=key)
+    """Кэш в Redis с метриками по логическим кэшам.
 
-    def set(
+    Если в одной базе лежат разные сущности, key_prefixes задает имя
+    кэша для метрик по префиксу ключа, например {"user:": "user"}.
+    """
+
+    def __init__(self, cache_instance, name: str = "cache", key_prefixes: Optional[Dict[str, str]] = None):
+        super().__init__(cache_instance=cache_instance)
+        self.name = name
+        self.key_prefixes = key_prefixes or {}
+
+    def _cache_name(self, key: str) -> str:
+        for prefix, name in self.key_prefixes.items():
+            if key.startswith(prefix):
+                return name
+        return self.name
+
+    async def get(self, key: str) -> Optional[dict]:
+        name = self._cache_name(key)
+        started = time.perf_counter()
+        value = await self.cache.get(name=key)
+        CACHE_LATENCY.labels(name, "get").observe(time.perf_counter() - started)
+        CACHE_REQUESTS.labels(name, "get", "hit" if value is not None else "miss").inc()
+        return value
+
+    async def get_many(self, keys: List[str]) -> list:
+        """Получить значения нескольких ключей за один запрос (MGET)."""
+        if not keys:
+            return []
+        name = self._cache_name(keys[0])
+        started = time.perf_counter()
+        values = await self.cache.mget(keys)
+        CACHE_LATENCY.labels(name, "get_many").observe(time.perf_counter() - started)
+        hits = sum(value is not None for value in values)
+        CACHE_REQUESTS.labels(name, "get_many", "hit").inc(hits)
+        CACHE_REQUESTS.labels(name, "get_many", "miss").inc(len(values) - hits)
+        return values
+
+    async def set(
         self,
         key: str,
         value: Union[bytes, str],
         expire: int = config.CACHE_EXPIRE_IN_SECONDS,
     ):
-        self.cache.set(name=key, value=value, ex=expire)
+        name = self._cache_name(key)
+        started = time.perf_counter()
+        await self.cache.set(name=key, value=value, ex=expire)
+        CACHE_LATENCY.labels(name, "set").observe(time.perf_counter() - started)
+        CACHE_REQUESTS.labels(name, "set", "").inc()
+
+    async def set_many(
+        self,
+        mapping: Dict[str, Union[bytes, str]],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ):
+        """Записать несколько ключей одним пайплайном (у MSET нет TTL)."""
+        if not mapping:
+            return
+        name = self._cache_name(next(iter(mapping)))
+        started = time.perf_counter()
+        async with self.cache.pipeline(transaction=False) as pipe:
+            for key, value in mapping.items():
+                pipe.set(name=key, value=value, ex=expire)
+            await pipe.execute()
+        CACHE_LATENCY.labels(name, "set_many").observe(time.perf_counter() - started)
+        CACHE_REQUESTS.labels(name, "set_many", "").inc(len(mapping))
 
-    def close(self) -> NoReturn:
-        self.cache.close()
+    async def close(self) -> NoReturn:
+        await self.cache.close()
@@ -0,0 +1,101 @@
+from typing import Dict, Optional, Tuple
+
+from redis import asyncio as aioredis
+
+from src.core.metrics import REDIS_POOL_CONNECTIONS, REDIS_POOL_MAX_CONNECTIONS
+
+__all__ = ("RedisConnectionManager", "get_redis_manager")
+
+
+class RedisConnectionManager:
+    """Владелец пулов соединений Redis.
+
+    На каждую пару (база, decode_responses) заводится один ограниченный
+    пул, и все клиенты этой базы работают через него. Когда пул исчерпан,
+    команда ждет освободившееся соединение до pool_timeout, а не открывает
+    новое. Загрузка пулов доступна через stats() и метрики Prometheus.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        max_connections: int,
+        pool_timeout: float,
+        socket_timeout: float,
+        socket_connect_timeout: float,
+        health_check_interval: int,
+    ):
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self.socket_timeout = socket_timeout
+        self.socket_connect_timeout = socket_connect_timeout
+        self.health_check_interval = health_check_interval
+        self._pools: Dict[Tuple[int, bool, bool], aioredis.BlockingConnectionPool] = {}
+
+    def client(self, db: int, decode_responses: bool = False) -> aioredis.Redis:
+        return aioredis.Redis(connection_pool=self._pool(db, decode_responses, pubsub=False))
+
+    def pubsub_client(self, db: int) -> aioredis.Redis:
+        """Клиент для подписок: соединение подписки подолгу молчит, поэтому без socket_timeout."""
+        return aioredis.Redis(connection_pool=self._pool(db, decode_responses=False, pubsub=True))
+
+    def _pool(self, db: int, decode_responses: bool, pubsub: bool) -> aioredis.BlockingConnectionPool:
+        key = (db, decode_responses, pubsub)
+        if key not in self._pools:
+            name = self._pool_name(key)
+            max_connections = 1 if pubsub else self.max_connections
+            pool = aioredis.BlockingConnectionPool(
+                host=self.host,
+                port=self.port,
+                db=db,
+                decode_responses=decode_responses,
+                max_connections=max_connections,
+                timeout=self.pool_timeout,
+                socket_timeout=None if pubsub else self.socket_timeout,
+                socket_connect_timeout=self.socket_connect_timeout,
+                health_check_interval=self.health_check_interval,
+            )
+            self._pools[key] = pool
+            REDIS_POOL_MAX_CONNECTIONS.labels(name).set(max_connections)
+            REDIS_POOL_CONNECTIONS.labels(name, "created").set_function(lambda pool=pool: self._created(pool))
+            REDIS_POOL_CONNECTIONS.labels(name, "in_use").set_function(lambda pool=pool: self._in_use(pool))
+        return self._pools[key]
+
+    @staticmethod
+    def _pool_name(key: Tuple[int, bool, bool]) -> str:
+        db, decode_responses, pubsub = key
+        return f"db{db}" + ("-decoded" if decode_responses else "") + ("-pubsub" if pubsub else "")
+
+    @staticmethod
+    def _created(pool: aioredis.BlockingConnectionPool) -> int:
+        return len(pool._connections)
+
+    @staticmethod
+    def _in_use(pool: aioredis.BlockingConnectionPool) -> int:
+        # Очередь пула заполнена свободными соединениями и заглушками None
+        return pool.max_connections - pool.pool.qsize()
+
+    def stats(self) -> Dict[str, dict]:
+        return {
+            self._pool_name(key): {
+                "max": pool.max_connections,
+                "created": self._created(pool),
+                "in_use": self._in_use(pool),
+            }
+            for key, pool in self._pools.items()
+        }
+
+    async def close(self):
+        for pool in self._pools.values():
+            await pool.disconnect()
+        self._pools = {}
+
+
+redis_manager: Optional[RedisConnectionManager] = None
+
+
+def get_redis_manager() -> Optional[RedisConnectionManager]:
+    return redis_manager
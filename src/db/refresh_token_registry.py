@@ -0,0 +1,100 @@
+import time
+from datetime import datetime, timezone
+from typing import Optional, Union
+
+from src.core.metrics import CACHE_LATENCY, CACHE_REQUESTS
+
+__all__ = ("RefreshTokenRegistry", "get_refresh_token_registry")
+
+
+# Для каждого пользователя — отсортированное множество refresh:{username}
+# с jti активных refresh-токенов и временем их истечения в качестве score.
+# Скрипты выполняются в Redis атомарно: параллельные входы не теряют токены,
+# а ротация не может дважды использовать один и тот же токен.
+
+# Имя кэша в метриках
+CACHE_NAME = "refresh_tokens"
+
+# Общая часть: убрать истекшие и лишние токены, продлить ключ до самого позднего exp
+_TRIM = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -tonumber(ARGV[2]) - 1)
+local last = redis.call('ZRANGE', KEYS[1], -1, -1, 'WITHSCORES')
+if last[2] then
+    redis.call('EXPIREAT', KEYS[1], math.ceil(tonumber(last[2])))
+end
+"""
+
+# KEYS[1] — ключ пользователя; ARGV: now, max_tokens, jti, exp
+ADD_SCRIPT = """
+redis.call('ZADD', KEYS[1], ARGV[4], ARGV[3])
+""" + _TRIM + """
+return 1
+"""
+
+# KEYS[1] — ключ пользователя; ARGV: now, max_tokens, old_jti, new_jti, new_exp
+ROTATE_SCRIPT = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[3])
+if not score or tonumber(score) <= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[3])
+redis.call('ZADD', KEYS[1], ARGV[5], ARGV[4])
+""" + _TRIM + """
+return 1
+"""
+
+
+def _timestamp(exp: Union[datetime, int, float]) -> float:
+    if isinstance(exp, datetime):
+        return exp.replace(tzinfo=timezone.utc).timestamp()
+    return exp
+
+
+class RefreshTokenRegistry:
+    """Реестр активных refresh-токенов по их jti."""
+
+    def __init__(self, redis, max_tokens_per_user: int):
+        self.redis = redis
+        self.max_tokens_per_user = max_tokens_per_user
+        self._add = redis.register_script(ADD_SCRIPT)
+        self._rotate = redis.register_script(ROTATE_SCRIPT)
+
+    @staticmethod
+    def _key(username: str) -> str:
+        return f"refresh:{username}"
+
+    @staticmethod
+    def _observe(operation: str, started: float, result: str = ""):
+        CACHE_LATENCY.labels(CACHE_NAME, operation).observe(time.perf_counter() - started)
+        CACHE_REQUESTS.labels(CACHE_NAME, operation, result).inc()
+
+    async def add(self, username: str, jti: str, exp: Union[datetime, int, float]):
+        started = time.perf_counter()
+        await self._add(
+            keys=[self._key(username)],
+            args=[time.time(), self.max_tokens_per_user, jti, _timestamp(exp)],
+        )
+        self._observe("add", started)
+
+    async def rotate(self, username: str, old_jti: str, new_jti: str, new_exp: Union[datetime, int, float]) -> bool:
+        """Заменить old_jti на new_jti. False — если old_jti уже не активен."""
+        started = time.perf_counter()
+        rotated = await self._rotate(
+            keys=[self._key(username)],
+            args=[time.time(), self.max_tokens_per_user, old_jti, new_jti, _timestamp(new_exp)],
+        )
+        self._observe("rotate", started, "hit" if rotated else "miss")
+        return bool(rotated)
+
+    async def revoke_all(self, username: str):
+        started = time.perf_counter()
+        await self.redis.delete(self._key(username))
+        self._observe("revoke_all", started)
+
+
+refresh_token_registry: Optional[RefreshTokenRegistry] = None
+
+
+def get_refresh_token_registry() -> Optional[RefreshTokenRegistry]:
+    return refresh_token_registry
@@ -0,0 +1,32 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+__all__ = ("SingleFlight",)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Объединение одновременных загрузок одного ключа в воркере.
+
+    Пока загрузка ключа идет, остальные вызовы с тем же ключом ждут ее
+    результат. Загрузка выполняется в отдельной задаче, поэтому отмена
+    одного из ожидающих запросов не прерывает ее для остальных.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(loader())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        self._calls.pop(key, None)
+        # Ошибку получат ожидающие; если их не осталось, не засоряем лог
+        if not task.cancelled():
+            task.exception()
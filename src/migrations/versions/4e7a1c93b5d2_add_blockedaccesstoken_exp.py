@@ -0,0 +1,44 @@
+"""ADD BlockedAccessToken exp and indexes
+
+Revision ID: 4e7a1c93b5d2
+Revises: 8c2f4b7d9e31
+Create Date: 2026-10-18 11:03:17.284905
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = '4e7a1c93b5d2'
+down_revision = '8c2f4b7d9e31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Таблица могла быть создана приложением (SQLModel.metadata.create_all)
+    if not sa.inspect(op.get_bind()).has_table('blockedaccesstoken'):
+        op.create_table('blockedaccesstoken',
+        sa.Column('id', sa.Integer(), nullable=True),
+        sa.Column('jti', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('exp', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+    else:
+        op.add_column('blockedaccesstoken', sa.Column('exp', sa.DateTime(), nullable=True))
+        # access-токен живет 30 минут: старые записи станут истекшими не позже чем через 30 минут
+        op.execute(
+            "UPDATE blockedaccesstoken SET exp = (now() at time zone 'utc') + interval '30 minutes' "
+            "WHERE exp IS NULL"
+        )
+        op.alter_column('blockedaccesstoken', 'exp', nullable=False)
+    op.create_index(op.f('ix_blockedaccesstoken_jti'), 'blockedaccesstoken', ['jti'], unique=False)
+    op.create_index(op.f('ix_blockedaccesstoken_exp'), 'blockedaccesstoken', ['exp'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_blockedaccesstoken_exp'), table_name='blockedaccesstoken')
+    op.drop_index(op.f('ix_blockedaccesstoken_jti'), table_name='blockedaccesstoken')
+    op.drop_column('blockedaccesstoken', 'exp')
@@ -0,0 +1,32 @@
+"""ADD JwtSigningKey
+
+Revision ID: e2b8c5d1f347
+Revises: d7e9a2c4f610
+Create Date: 2026-10-18 15:42:08.631572
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b8c5d1f347'
+down_revision = 'd7e9a2c4f610'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Таблица могла быть создана приложением (SQLModel.metadata.create_all)
+    if not sa.inspect(op.get_bind()).has_table('jwtsigningkey'):
+        op.create_table('jwtsigningkey',
+        sa.Column('kid', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('created_at', sa.Float(), nullable=False),
+        sa.Column('private_key', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.PrimaryKeyConstraint('kid')
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('jwtsigningkey')
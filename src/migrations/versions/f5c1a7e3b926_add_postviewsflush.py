@@ -0,0 +1,31 @@
+"""ADD PostViewsFlush
+
+Revision ID: f5c1a7e3b926
+Revises: e2b8c5d1f347
+Create Date: 2026-10-18 16:20:51.407316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5c1a7e3b926'
+down_revision = 'e2b8c5d1f347'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Таблица могла быть создана приложением (SQLModel.metadata.create_all)
+    if not sa.inspect(op.get_bind()).has_table('postviewsflush'):
+        op.create_table('postviewsflush',
+        sa.Column('id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('flushed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('postviewsflush')
@@ -1,2 +1,3 @@
 from .post import *
+from .signing_key import *
 from .user import *
\ No newline at end of file
@@ -1,14 +1,44 @@
 from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import Column, Computed, Index
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlmodel import Field, SQLModel
 
-__all__ = ("Post",)
+__all__ = ("Post", "PostViewsFlush", "SEARCH_CONFIG")
+
+# Конфигурация полнотекстового поиска Postgres: русские слова и латиница со стеммингом
+SEARCH_CONFIG = "russian"
 
 
 class Post(SQLModel, table=True):
+    # Индекс для постраничного вывода по курсору (created_at, id)
+    __table_args__ = (Index("ix_post_created_at_id", "created_at", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str = Field(nullable=False)
     description: str = Field(nullable=False)
     views: int = Field(default=0)
-    created_at: datetime = Field(default=datetime.utcnow(), nullable=False)
+    created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+
+# Вычисляемая колонка для поиска. Она не входит в модель, чтобы не попадать
+# в ответы и кэш постов; в запросах — Post.__table__.c.search_vector
+Post.__table__.append_column(
+    Column(
+        "search_vector",
+        TSVECTOR,
+        Computed(
+            f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+            f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')",
+            persisted=True,
+        ),
+    )
+)
+Index("ix_post_search_vector", Post.__table__.c.search_vector, postgresql_using="gin")
+
+
+class PostViewsFlush(SQLModel, table=True):
+    """Примененный перенос просмотров из Redis; повтор того же переноса пропускается."""
+    id: str = Field(primary_key=True)
+    flushed_at: datetime = Field(nullable=False)
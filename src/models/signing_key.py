@@ -0,0 +1,11 @@
+from sqlmodel import Field, SQLModel
+
+__all__ = ("JwtSigningKey",)
+
+
+class JwtSigningKey(SQLModel, table=True):
+    kid: str = Field(primary_key=True)
+    # unix-время создания ключа
+    created_at: float = Field(nullable=False)
+    # PKCS8 PEM, зашифрованный ключом JWT_KEYS_ENCRYPTION_KEY
+    private_key: str = Field(nullable=False)
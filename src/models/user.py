@@ -1,5 +1,6 @@
 from datetime import datetime
 from typing import Optional
+from sqlalchemy import Index
 from sqlalchemy.ext.mutable import MutableList
 
 from sqlmodel import Field, SQLModel
@@ -8,6 +9,12 @@ __all__ = ("User", "BlockedAccessToken")
 
 
 class User(SQLModel, table=True):
+    # Уникальность проверяет сама база: вставка с ON CONFLICT за один запрос
+    __table_args__ = (
+        Index("ix_user_username", "username", unique=True),
+        Index("ix_user_email", "email", unique=True),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     username: str = Field(nullable=False)
     roles: MutableList[str] = Field(default=['common_user'])
@@ -21,4 +28,6 @@ class User(SQLModel, table=True):
 
 class BlockedAccessToken(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    jti: str = Field(nullable=False)
\ No newline at end of file
+    jti: str = Field(nullable=False, index=True)
+    # Время истечения токена: после него запись можно удалять
+    exp: datetime = Field(nullable=False, index=True)
\ No newline at end of file
@@ -1,4 +1,6 @@
 from .mixins import *
+from .hashing import *
 from .post import *
 from .auth import *
+from .revocation import *
 from .user import *
\ No newline at end of file
@@ -1,84 +1,117 @@
 import logging
+import time
 from datetime import datetime, timedelta
+from typing import Tuple
 import uuid
 import jwt
 from fastapi import HTTPException, status
-from passlib.context import CryptContext
 
-
-from src.core.config import JWT_SECRET_KEY, JWT_ALGORITHM
+from src.core.config import (
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    JWT_ALGORITHM,
+    JWT_HS256_ACCEPTED_UNTIL,
+    JWT_SECRET_KEY,
+    REFRESH_TOKEN_EXPIRE_HOURS,
+    VERIFIED_TOKENS_CACHE_SIZE,
+)
+from src.db.local_cache import LocalCache
+from src.services import signing_keys
+from src.services.hashing import hashing_executor
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
 class Auth():
-    hasher = CryptContext(schemes=['bcrypt'])
     secret = JWT_SECRET_KEY
+    # Недавно проверенные токены: подпись -> (подписанная часть токена, payload).
+    # Запись живет до exp токена, повторная проверка подписи не нужна.
+    verified_tokens = LocalCache(name="verified_tokens", max_size=VERIFIED_TOKENS_CACHE_SIZE, ttl=0)
+
+    async def encode_password(self, password):
+        return await hashing_executor.hash(password)
+
+    async def verify_password(self, password, encoded_password):
+        return await hashing_executor.verify(password, encoded_password)
 
-    def encode_password(self, password):
-        return self.hasher.hash(password)
+    def _encode(self, payload) -> str:
+        """Подписать payload: общим секретом (HS*) или текущим ключом из KeyRing."""
+        if signing_keys.key_ring is None:
+            return jwt.encode(payload, self.secret, algorithm=JWT_ALGORITHM)
+        key = signing_keys.key_ring.signing_key()
+        return jwt.encode(payload, key.private_key, algorithm=JWT_ALGORITHM, headers={'kid': key.kid})
 
-    def verify_password(self, password, encoded_password):
-        return self.hasher.verify(password, encoded_password)
+    def _decode(self, token) -> dict:
+        if signing_keys.key_ring is None:
+            return jwt.decode(token, self.secret, algorithms=[JWT_ALGORITHM])
+        header = jwt.get_unverified_header(token)
+        if header.get('alg') == 'HS256' and time.time() < JWT_HS256_ACCEPTED_UNTIL:
+            # Переходный период: токены, выданные до смены алгоритма
+            return jwt.decode(token, self.secret, algorithms=['HS256'])
+        public_key = signing_keys.key_ring.public_key(header.get('kid'))
+        if public_key is None:
+            raise jwt.InvalidTokenError('Unknown signing key')
+        return jwt.decode(token, public_key, algorithms=[JWT_ALGORITHM])
 
     def encode_token(self, username):
         logger.debug('encode_token')
         payload = {
-            'exp': datetime.utcnow() + timedelta(days=0, minutes=30),
+            'exp': datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
             'iat': datetime.utcnow(),
             'scope': 'access_token',
             'sub': username,
             'jti': str(uuid.uuid4())
         }
-        return jwt.encode(
-            payload,
-            self.secret,
-            algorithm=JWT_ALGORITHM
-        )
+        return self._encode(payload)
 
-    def decode_token(self, token):
-        logger.debug('decode_token')
-        try:
-            payload = jwt.decode(token, self.secret, algorithms=[JWT_ALGORITHM])
-            if (payload['scope'] == 'access_token'):
+    def verify_token(self, token) -> dict:
+        """Проверить подпись и срок действия токена и вернуть его payload."""
+        signing_input, _, signature = token.rpartition('.')
+        if cached := self.verified_tokens.get(signature):
+            cached_signing_input, payload = cached
+            if cached_signing_input == signing_input:
                 return payload
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Scope for the token is invalid')
+        try:
+            payload = self._decode(token)
         except jwt.ExpiredSignatureError as e:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Token expired: {}'.format(e.args))
         except jwt.InvalidTokenError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid token')
+        self.verified_tokens.set(signature, (signing_input, payload), ttl=payload['exp'] - time.time())
+        return payload
+
+    def decode_token(self, token):
+        logger.debug('decode_token')
+        payload = self.verify_token(token)
+        if (payload['scope'] == 'access_token'):
+            return payload
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Scope for the token is invalid')
 
     def encode_refresh_token(self, username):
+        return self.new_refresh_token(username)[0]
+
+    def new_refresh_token(self, username) -> Tuple[str, dict]:
+        """Выпустить refresh-токен и вернуть его вместе с payload."""
         payload = {
-            'exp': datetime.utcnow() + timedelta(days=0, hours=10),
+            'exp': datetime.utcnow() + timedelta(hours=REFRESH_TOKEN_EXPIRE_HOURS),
             'iat': datetime.utcnow(),
             'scope': 'refresh_token',
             'sub': username,
             'jti': str(uuid.uuid4())
         }
-        return jwt.encode(
-            payload,
-            self.secret,
-            algorithm=JWT_ALGORITHM
-        )
+        return self._encode(payload), payload
     
     def decode_refresh_token(self, token):
         logger.debug('decode_refresh_token')
-        try:
-            payload = jwt.decode(token, self.secret, algorithms=[JWT_ALGORITHM])
-            if (payload['scope'] == 'refresh_token'):
-                return payload
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Scope for the token is invalid')
-        except jwt.ExpiredSignatureError as e:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Token expired: {}'.format(e.args))
-        except jwt.InvalidTokenError:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid token')
+        payload = self.verify_token(token)
+        if (payload['scope'] == 'refresh_token'):
+            return payload
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Scope for the token is invalid')
 
     def update_refresh_token(self, refresh_token):
         logger.debug('update_refresh_token')
         try:
-            payload = jwt.decode(refresh_token, self.secret, algorithms=[JWT_ALGORITHM])
+            payload = self._decode(refresh_token)
             logger.debug(payload['scope'])
             if (payload['scope'] == 'refresh_token'):
                 username = payload['sub']
@@ -93,7 +126,7 @@ class Auth():
     def update_access_token(self, access_token):
         logger.debug('update_access_token')
         try:
-            payload = jwt.decode(access_token, self.secret, algorithms=[JWT_ALGORITHM])
+            payload = self._decode(access_token)
             logger.debug(payload['scope'])
             if (payload['scope'] == 'access_token'):
                 username = payload['sub']
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from src.core import config
+from src.core.metrics import HASHING_IN_PROGRESS, HASHING_LATENCY, HASHING_QUEUE_DEPTH, HASHING_REJECTED
+
+__all__ = ("HashingExecutor", "hashing_executor")
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+hasher = CryptContext(schemes=['bcrypt'])
+
+
+# Функции выполняются в дочерних процессах, поэтому должны быть на уровне модуля
+def _hash_password(password: str) -> str:
+    return hasher.hash(password)
+
+
+def _verify_password(password: str, encoded_password: str) -> bool:
+    return hasher.verify(password, encoded_password)
+
+
+class HashingExecutor:
+    """Пул процессов для bcrypt с ограниченной очередью.
+
+    Если в пуле и очереди уже `pool_size + queue_size` операций, новая
+    операция сразу получает 503, а не копится в памяти.
+    """
+
+    def __init__(self, pool_size: int, queue_size: int):
+        self.pool_size = pool_size
+        self.queue_size = queue_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return max(self._pending - self.pool_size, 0)
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.pool_size)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def hash(self, password: str) -> str:
+        return await self._run('hash', _hash_password, password)
+
+    async def verify(self, password: str, encoded_password: str) -> bool:
+        return await self._run('verify', _verify_password, password, encoded_password)
+
+    async def _run(self, operation: str, func, *args):
+        if self._pending >= self.pool_size + self.queue_size:
+            HASHING_REJECTED.labels(operation).inc()
+            logger.warning('Hashing queue is full, rejecting %s', operation)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail='Server is busy, try again later.',
+                headers={'Retry-After': '1'},
+            )
+        self.start()
+        self._pending += 1
+        self._update_gauges()
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+            self._update_gauges()
+            HASHING_LATENCY.labels(operation).observe(time.perf_counter() - started)
+
+    def _update_gauges(self):
+        HASHING_QUEUE_DEPTH.set(self.queue_depth)
+        HASHING_IN_PROGRESS.set(min(self._pending, self.pool_size))
+
+
+hashing_executor = HashingExecutor(
+    pool_size=config.HASHING_POOL_SIZE,
+    queue_size=config.HASHING_QUEUE_SIZE,
+)
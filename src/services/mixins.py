@@ -1,11 +1,11 @@
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.db import AbstractCache
 
 
 class ServiceMixin:
-    def __init__(self, cache: AbstractCache, session: Session):
+    def __init__(self, cache: AbstractCache, session: AsyncSession):
         self.cache: AbstractCache = cache
-        self.session: Session = session
+        self.session: AsyncSession = session
 
 
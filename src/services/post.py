@@ -1,64 +1,470 @@
+import asyncio
+import base64
+import binascii
+import hashlib
 import json
 import logging
+import random
+import uuid
+from datetime import datetime, timezone
 from functools import lru_cache
-from typing import Optional
+from typing import AsyncIterator, List, Optional, Tuple
 
-from fastapi import Depends
-from sqlmodel import Session
+import orjson
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import Integer, column, delete, func, literal_column, tuple_, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.api.v1.schemas import PostCreate, PostModel
-from src.db import AbstractCache, get_cache, get_session
-from src.models import Post
+from src.api.v1.schemas import PostCreate, PostListResponse, PostModel, PostSearchResponse
+from src.core import config
+from src.core.metrics import POST_VIEWS_FLUSHED
+from src.db import AbstractCache, SingleFlight, get_cache, get_session
+from src.db.db import async_session
+from src.models import Post, PostViewsFlush, SEARCH_CONFIG
 from src.services import ServiceMixin
 
-__all__ = ("PostService", "get_post_service")
+__all__ = ("PostService", "get_post_service", "run_post_views_flush", "feed_etag")
 
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Отсортированное множество id постов, score — время создания поста.
+# id дополняется нулями, чтобы посты с одинаковым score шли по возрастанию id.
+POSTS_INDEX_KEY = "posts:index"
+POSTS_INDEX_LOCK_KEY = "posts:index:lock"
+# Пустое множество в Redis не хранится: построенный пустой индекс отмечается
+# этим ключом, чтобы каждый запрос не запускал перестроение заново
+POSTS_INDEX_EMPTY_KEY = "posts:index:empty"
+INDEX_EMPTY_TTL_SECONDS = 5
+INDEX_REBUILD_BATCH_SIZE = 1000
+INDEX_REBUILD_LOCK_SECONDS = 60
+
+# Добавить посты в индекс, только если он уже построен (в том числе пустым)
+INDEX_ADD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 or redis.call('DEL', KEYS[2]) == 1 then
+    redis.call('ZADD', KEYS[1], unpack(ARGV))
+end
+"""
+
+# Готовые ответы списка постов лежат в ключах с номером версии ленты.
+# Версия увеличивается при каждом изменении ленты (новые посты, перенос
+# просмотров), поэтому старые страницы просто перестают читаться.
+POSTS_FEED_VERSION_KEY = "posts:feed:version"
+# Результаты поиска зависят только от набора постов: версия поиска растет
+# при новых постах, а число просмотров в них обновляется по TTL кэша.
+POSTS_SEARCH_VERSION_KEY = "posts:search:version"
+
+# Хэш post_id -> еще не перенесенные в Postgres просмотры. При переносе он
+# целиком переименовывается в POST_VIEWS_FLUSHING_KEY, а новые просмотры
+# копятся в новом хэше. Переносу присваивается id (POST_VIEWS_FLUSH_ID_KEY),
+# который записывается в Postgres в одной транзакции с просмотрами.
+POST_VIEWS_PENDING_KEY = "posts:views:pending"
+POST_VIEWS_FLUSHING_KEY = "posts:views:flushing"
+POST_VIEWS_FLUSH_ID_KEY = "posts:views:flushing:id"
+POST_VIEWS_FLUSH_LOCK_KEY = "posts:views:flush:lock"
+
+# Значение в кэше для id, которого нет в Postgres
+MISSING_POST = ""
+
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора
+_background_tasks = set()
+# Загрузки поста из Postgres при промахе кэша, по одной на id в воркере
+_post_loads = SingleFlight()
+# Поиск при промахе кэша, по одному на ключ страницы результатов в воркере
+_search_loads = SingleFlight()
+
+
+def post_cache_ttl() -> int:
+    jitter = config.POSTS_CACHE_TTL_JITTER
+    return int(config.CACHE_EXPIRE_IN_SECONDS * random.uniform(1 - jitter, 1 + jitter))
+
+
+def post_score(created_at: datetime) -> float:
+    return created_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+def score_to_datetime(score: float) -> datetime:
+    return datetime.fromtimestamp(score, tz=timezone.utc).replace(tzinfo=None)
+
+
+def index_member(post_id: int) -> str:
+    return f"{post_id:012d}"
+
+
+def encode_cursor(created_at: datetime, post_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), post_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, post_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(post_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+
+
+async def rebuild_post_index(cache: AbstractCache):
+    """Построить индекс постов из Postgres.
+
+    Запускается в фоне одним воркером (блокировка в Redis). Индекс
+    собирается во временном ключе и подменяет основной через RENAME.
+    Временный ключ живет не дольше блокировки, даже если воркер упал.
+    """
+    if not await cache.cache.set(POSTS_INDEX_LOCK_KEY, 1, nx=True, ex=INDEX_REBUILD_LOCK_SECONDS):
+        return
+    tmp_key = f"{POSTS_INDEX_KEY}:rebuild:{uuid.uuid4()}"
+    try:
+        logger.debug('Rebuild posts index in redis cache.')
+        last_id = 0
+        async with async_session() as session:
+            result = await session.stream(select(Post.id, Post.created_at))
+            async for rows in result.partitions(INDEX_REBUILD_BATCH_SIZE):
+                async with cache.cache.pipeline(transaction=False) as pipe:
+                    pipe.zadd(tmp_key, {index_member(post_id): post_score(created_at) for post_id, created_at in rows})
+                    pipe.expire(tmp_key, INDEX_REBUILD_LOCK_SECONDS)
+                    await pipe.execute()
+                last_id = max(last_id, *(post_id for post_id, _ in rows))
+            if not last_id:
+                await cache.cache.set(POSTS_INDEX_EMPTY_KEY, 1, ex=INDEX_EMPTY_TTL_SECONDS)
+                # Пост мог появиться, пока мы убеждались, что их нет
+                if (await session.execute(select(Post.id).limit(1))).first():
+                    await cache.cache.delete(POSTS_INDEX_EMPTY_KEY)
+                return
+            async with cache.cache.pipeline(transaction=True) as pipe:
+                pipe.rename(tmp_key, POSTS_INDEX_KEY)
+                pipe.persist(POSTS_INDEX_KEY)
+                pipe.delete(POSTS_INDEX_EMPTY_KEY)
+                await pipe.execute()
+            # Посты, созданные во время перестроения, могли не попасть в индекс
+            result = await session.execute(select(Post.id, Post.created_at).where(Post.id > last_id))
+            if rows := result.all():
+                await cache.cache.zadd(
+                    POSTS_INDEX_KEY, {index_member(post_id): post_score(created_at) for post_id, created_at in rows}
+                )
+    finally:
+        # После RENAME временного ключа уже нет; при ошибке удаляем недостроенный индекс
+        await cache.cache.delete(tmp_key, POSTS_INDEX_LOCK_KEY)
+
+
+async def flush_post_views(cache: AbstractCache, batch_size: int) -> int:
+    """Перенести накопленные в Redis просмотры в Postgres и вернуть число постов."""
+    redis = cache.cache
+    # Незавершенный прошлый перенос доделываем, иначе забираем все накопленное
+    if not await redis.exists(POST_VIEWS_FLUSHING_KEY):
+        if not await redis.exists(POST_VIEWS_PENDING_KEY):
+            return 0
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.rename(POST_VIEWS_PENDING_KEY, POST_VIEWS_FLUSHING_KEY)
+            pipe.set(POST_VIEWS_FLUSH_ID_KEY, uuid.uuid4().hex)
+            await pipe.execute()
+    flush_id = await redis.get(POST_VIEWS_FLUSH_ID_KEY)
+    if flush_id is None:
+        # Перенос начат версией без id: доделываем его под новым id
+        flush_id = uuid.uuid4().hex.encode()
+        await redis.set(POST_VIEWS_FLUSH_ID_KEY, flush_id)
+    flush_id = flush_id.decode()
+    deltas = [(int(post_id), int(delta)) for post_id, delta in (await redis.hgetall(POST_VIEWS_FLUSHING_KEY)).items()]
+    if deltas:
+        async with async_session() as session:
+            # Если воркер упал после commit, но до очистки Redis, повторный
+            # перенос найдет свой id в базе и не применит просмотры второй раз
+            applied = (await session.execute(
+                insert(PostViewsFlush)
+                .values(id=flush_id, flushed_at=datetime.utcnow())
+                .on_conflict_do_nothing()
+                .returning(PostViewsFlush.id)
+            )).scalar_one_or_none()
+            if applied is None:
+                logger.info('Post views flush %s was already applied.', flush_id)
+            else:
+                # Повториться может только текущий перенос: прошлые уже убраны из Redis
+                await session.execute(delete(PostViewsFlush).where(PostViewsFlush.id != flush_id))
+                for start in range(0, len(deltas), batch_size):
+                    batch = values(column("id", Integer), column("delta", Integer), name="deltas").data(
+                        deltas[start:start + batch_size]
+                    )
+                    # UPDATE post SET views = post.views + deltas.delta FROM (VALUES ...) AS deltas ...
+                    await session.execute(
+                        update(Post)
+                        .where(Post.id == batch.c.id)
+                        .values(views=func.coalesce(Post.views, 0) + batch.c.delta)
+                        .execution_options(synchronize_session=False)
+                    )
+                await session.commit()
+    # Закэшированные посты и страницы хранят старое число просмотров
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.delete(POST_VIEWS_FLUSHING_KEY, POST_VIEWS_FLUSH_ID_KEY, *(f"post{post_id}" for post_id, _ in deltas))
+        if deltas:
+            pipe.incr(POSTS_FEED_VERSION_KEY)
+        await pipe.execute()
+    return len(deltas)
+
+
+async def run_post_views_flush(cache: AbstractCache, interval: int, batch_size: int):
+    """Периодически переносить просмотры в Postgres; за интервал это делает один воркер."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if await cache.cache.set(POST_VIEWS_FLUSH_LOCK_KEY, 1, nx=True, ex=interval):
+                flushed = await flush_post_views(cache, batch_size)
+                POST_VIEWS_FLUSHED.inc(flushed)
+                logger.debug('Flushed views of %s posts.', flushed)
+        except Exception:
+            logger.exception('Post views flush failed')
+
+
+def feed_etag(version: int, after: Optional[str], limit: int) -> str:
+    """Сильный ETag страницы ленты: меняется вместе с версией ленты."""
+    page = hashlib.blake2b(f"{limit}:{after or ''}".encode(), digest_size=8).hexdigest()
+    return f'"posts-{version}-{page}"'
+
 
 class PostService(ServiceMixin):
-    def get_post_list(self) -> dict:
-        """Получить список постов."""
-        posts = []
-        for key in self.cache.cache.keys("post*"):
-            posts.append(json.loads(self.cache.get(key=key)))
-        if not posts:
-            posts = self.session.query(Post).order_by(Post.created_at).all()
-            return {"posts": [PostModel(**post.dict()) for post in posts]}
-        else:
-            logger.debug('Got list of posts from redis cache.')
-            return {"posts": [PostModel(**post) for post in posts]}
-        
-
-    def get_post_detail(self, item_id: int) -> Optional[dict]:
+    async def get_feed_version(self) -> int:
+        return int(await self.cache.cache.get(POSTS_FEED_VERSION_KEY) or 0)
+
+    async def get_post_list_response(
+            self, after: Optional[str] = None, limit: int = config.POSTS_PAGE_SIZE, version: Optional[int] = None) -> bytes:
+        """Готовый JSON страницы списка постов; pydantic работает только при промахе кэша."""
+        if version is None:
+            version = await self.get_feed_version()
+        page_key = f"posts:page:{version}:{limit}:{after or ''}"
+        if cached_page := await self.cache.get(key=page_key):
+            return cached_page
+        page = orjson.dumps(PostListResponse(**await self.get_post_list(after=after, limit=limit)).dict())
+        await self.cache.set(key=page_key, value=page, expire=config.POSTS_PAGE_CACHE_TTL_SECONDS)
+        return page
+
+    async def get_post_list(self, after: Optional[str] = None, limit: int = config.POSTS_PAGE_SIZE) -> dict:
+        """Получить страницу списка постов.
+
+        Страница задается курсором по (created_at, id) последнего поста
+        предыдущей страницы. Идентификаторы постов берутся из
+        отсортированного множества в Redis, а пока его нет — из Postgres по
+        составному индексу.
+        """
+        cursor = decode_cursor(after) if after else None
+        page = await self._get_page_from_index(cursor, limit + 1)
+        if page is None:
+            page = await self._get_page_from_db(cursor, limit + 1)
+
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            last_id, last_created_at = page[-1]
+            next_cursor = encode_cursor(last_created_at, last_id)
+        posts = await self._load_posts([post_id for post_id, _ in page])
+        return {
+            "posts": [PostModel(**posts[post_id]) for post_id, _ in page if post_id in posts],
+            "next_cursor": next_cursor,
+        }
+
+    async def _get_page_from_index(
+            self, cursor: Optional[Tuple[datetime, int]], limit: int) -> Optional[List[Tuple[int, datetime]]]:
+        """Получить id и время создания постов страницы из индекса в Redis.
+
+        Возвращает None, если индекса нет: тогда он перестраивается в фоне.
+        """
+        async with self.cache.cache.pipeline(transaction=False) as pipe:
+            pipe.exists(POSTS_INDEX_KEY, POSTS_INDEX_EMPTY_KEY)
+            if cursor is None:
+                pipe.zrangebyscore(POSTS_INDEX_KEY, '-inf', '+inf', start=0, num=limit, withscores=True)
+            else:
+                score = post_score(cursor[0])
+                # Посты с тем же временем создания, что у курсора, и все более поздние
+                pipe.zrangebyscore(POSTS_INDEX_KEY, score, score, withscores=True)
+                pipe.zrangebyscore(POSTS_INDEX_KEY, f"({score}", '+inf', start=0, num=limit, withscores=True)
+            index_exists, *ranges = await pipe.execute()
+
+        if not index_exists:
+            self._schedule_index_rebuild()
+            return None
+        if cursor is not None:
+            ranges[0] = [(member, score) for member, score in ranges[0] if int(member) > cursor[1]]
+        members = [member for range_ in ranges for member in range_][:limit]
+        return [(int(member), score_to_datetime(score)) for member, score in members]
+
+    async def _get_page_from_db(
+            self, cursor: Optional[Tuple[datetime, int]], limit: int) -> List[Tuple[int, datetime]]:
+        """Получить id и время создания постов страницы из Postgres (keyset)."""
+        query = select(Post.id, Post.created_at).order_by(Post.created_at, Post.id).limit(limit)
+        if cursor is not None:
+            query = query.where(tuple_(Post.created_at, Post.id) > tuple_(*cursor))
+        result = await self.session.execute(query)
+        return [(post_id, created_at) for post_id, created_at in result.all()]
+
+    async def _load_posts(self, post_ids: List[int]) -> dict:
+        """Получить посты по id: из кэша одним MGET, недостающие — из Postgres."""
+        if not post_ids:
+            return {}
+        posts = {}
+        missing_ids = []
+        cached_posts = await self.cache.get_many([f"post{post_id}" for post_id in post_ids])
+        for post_id, cached_post in zip(post_ids, cached_posts):
+            if cached_post:
+                posts[post_id] = orjson.loads(cached_post)
+            else:
+                missing_ids.append(post_id)
+
+        if missing_ids:
+            logger.debug('Load %s posts missing in redis cache from db.', len(missing_ids))
+            result = await self.session.exec(select(Post).where(Post.id.in_(missing_ids)))
+            loaded = {}
+            for post in result.all():
+                posts[post.id] = post.dict()
+                loaded[f"post{post.id}"] = post.json()
+            await self.cache.set_many(loaded, expire=post_cache_ttl())
+        return posts
+
+    def _schedule_index_rebuild(self):
+        task = asyncio.create_task(rebuild_post_index(self.cache))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    async def get_post_detail(self, item_id: int) -> Optional[dict]:
         """Получить детальную информацию поста."""
-        if cached_post := self.cache.get(key=f"post{item_id}"):
-            logger.debug('Load post from redis cache.')
-            return json.loads(cached_post)
+        cached_post = await self.cache.get(key=f"post{item_id}")
+        if cached_post is None:
+            cached_post = await _post_loads.do(item_id, lambda: self._load_post_detail(item_id))
+        if not cached_post:
+            return None
+        return orjson.loads(cached_post)
+
+    async def search_posts_response(self, query: str, page: int = 1, limit: int = config.POSTS_PAGE_SIZE) -> bytes:
+        """Готовый JSON страницы результатов поиска.
+
+        Страницы кэшируются с версией поиска в ключе, поэтому новый пост
+        сразу делает старые результаты недоступными. Перенос просмотров
+        версию не меняет: просмотры в результатах устаревают не дольше TTL.
+        """
+        query = " ".join(query.lower().split())
+        version = int(await self.cache.cache.get(POSTS_SEARCH_VERSION_KEY) or 0)
+        digest = hashlib.blake2b(query.encode(), digest_size=16).hexdigest()
+        page_key = f"posts:search:{version}:{digest}:{limit}:{page}"
+        if cached_page := await self.cache.get(key=page_key):
+            return cached_page
+        return await _search_loads.do(page_key, lambda: self._load_search_page(page_key, query, page, limit))
+
+    async def _load_search_page(self, page_key: str, query: str, page: int, limit: int) -> bytes:
+        search_vector = Post.__table__.c.search_vector
+        ts_query = func.websearch_to_tsquery(literal_column(f"'{SEARCH_CONFIG}'::regconfig"), query)
+        statement = (
+            select(Post.id, Post.title, Post.description, Post.views, Post.created_at)
+            .where(search_vector.op("@@")(ts_query))
+            .order_by(func.ts_rank_cd(search_vector, ts_query).desc(), Post.id.desc())
+            .offset((page - 1) * limit)
+            .limit(limit + 1)
+        )
+        async with async_session() as session:
+            rows = (await session.execute(statement)).all()
+        result = PostSearchResponse(
+            posts=[dict(row._mapping) for row in rows[:limit]],
+            page=page,
+            next_page=page + 1 if len(rows) > limit else None,
+        )
+        body = orjson.dumps(result.dict())
+        await self.cache.set(key=page_key, value=body, expire=config.POSTS_SEARCH_CACHE_TTL_SECONDS)
+        return body
 
-        post = self.session.query(Post).filter(Post.id == item_id).first()
-        if post:
-            self.cache.set(key=f"{post.id}", value=post.json())
-        return post.dict() if post else None
+    async def export_posts(self) -> AsyncIterator[bytes]:
+        """Все посты в NDJSON, пачками строк из серверного курсора.
 
-    def create_post(self, post: PostCreate) -> dict:
+        Читаются колонки, а не ORM-объекты, чтобы строки не копились в
+        identity map сессии: память не зависит от размера таблицы.
+        """
+        # Своя сессия: поток читается уже после выхода из обработчика запроса
+        async with async_session() as session:
+            result = await session.stream(
+                select(Post.id, Post.title, Post.description, Post.views, Post.created_at).order_by(Post.id)
+            )
+            async for rows in result.partitions(config.POSTS_EXPORT_BATCH_SIZE):
+                yield b"".join(orjson.dumps(dict(row._mapping)) + b"\n" for row in rows)
+
+    async def _load_post_detail(self, item_id: int) -> str:
+        """Загрузить пост из Postgres в кэш; для отсутствующего id — MISSING_POST."""
+        logger.debug('Load post %s from db.', item_id)
+        # Своя сессия: загрузку могут ждать несколько запросов
+        async with async_session() as session:
+            post = (await session.exec(select(Post).where(Post.id == item_id))).first()
+        if post is None:
+            await self.cache.set(key=f"post{item_id}", value=MISSING_POST, expire=config.POSTS_NEGATIVE_CACHE_TTL_SECONDS)
+            return MISSING_POST
+        value = post.json()
+        await self.cache.set(key=f"post{item_id}", value=value, expire=post_cache_ttl())
+        return value
+
+    async def view_post(self, item_id: int) -> Optional[bytes]:
+        """Засчитать просмотр и вернуть готовый JSON поста.
+
+        Просмотр увеличивает счетчик в Redis, а в ответе к сохраненному
+        в Postgres числу просмотров прибавляются еще не перенесенные.
+        Закэшированный пост уже совпадает с PostModel, поэтому pydantic
+        здесь не нужен.
+        """
+        post = await self.get_post_detail(item_id=item_id)
+        if not post:
+            return None
+        async with self.cache.cache.pipeline(transaction=False) as pipe:
+            pipe.hincrby(POST_VIEWS_PENDING_KEY, str(item_id), 1)
+            pipe.hget(POST_VIEWS_FLUSHING_KEY, str(item_id))
+            pending, flushing = await pipe.execute()
+        post['views'] = (post.get('views') or 0) + pending + int(flushing or 0)
+        return orjson.dumps(post)
+
+    async def create_post(self, post: PostCreate) -> dict:
         """Создать пост."""
         new_post = Post(title=post.title, description=post.description)
         self.session.add(new_post)
-        self.session.commit()
-        self.session.refresh(new_post)
+        await self.session.commit()
+        await self.session.refresh(new_post)
         new_post_dict = new_post.dict()
         new_post_dict['created_at'] = new_post_dict['created_at'].strftime('%Y-%m-%dT%H:%M:%S')
-        self.cache.set(key=f"post{new_post.id}", value=json.dumps(new_post_dict))
+        await self._cache_new_posts([new_post])
         return new_post_dict
 
+    async def create_posts(self, posts: List[PostCreate]) -> List[dict]:
+        """Создать несколько постов одним INSERT ... RETURNING."""
+        created_at = datetime.utcnow()
+        result = await self.session.execute(
+            insert(Post)
+            .values([
+                {'title': post.title, 'description': post.description, 'views': 0, 'created_at': created_at}
+                for post in posts
+            ])
+            .returning(Post.id, Post.title, Post.description, Post.views, Post.created_at)
+        )
+        # Порядок строк RETURNING не гарантирован, поэтому посты собираем из
+        # самих строк, а не сопоставляем с запросом по позиции
+        rows = sorted(result.all(), key=lambda row: row.id)
+        await self.session.commit()
+        new_posts = [Post(**row._mapping) for row in rows]
+        await self._cache_new_posts(new_posts)
+        return [new_post.dict() for new_post in new_posts]
+
+    async def _cache_new_posts(self, posts: List[Post]):
+        """Положить новые посты в кэш и в индекс одним пайплайном."""
+        async with self.cache.cache.pipeline(transaction=False) as pipe:
+            for post in posts:
+                pipe.set(f"post{post.id}", post.json(), ex=post_cache_ttl())
+            # Пока индекса нет, посты в него не добавляем: их соберет перестроение
+            scores = []
+            for post in posts:
+                scores.extend((post_score(post.created_at), index_member(post.id)))
+            pipe.eval(INDEX_ADD_SCRIPT, 2, POSTS_INDEX_KEY, POSTS_INDEX_EMPTY_KEY, *scores)
+            pipe.incr(POSTS_FEED_VERSION_KEY)
+            pipe.incr(POSTS_SEARCH_VERSION_KEY)
+            await pipe.execute()
+
 
 # get_post_service — это провайдер PostService. Синглтон
 @lru_cache()
 def get_post_service(
     cache: AbstractCache = Depends(get_cache),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
 ) -> PostService:
     return PostService(cache=cache, session=session)
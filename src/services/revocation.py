@@ -0,0 +1,143 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import delete
+from sqlmodel import select
+
+from src.core.metrics import REVOCATION_FILTER_CHECKS, REVOKED_TOKENS_PURGED
+from src.db import AbstractCache
+from src.db.bloom_filter import BloomFilter
+from src.db.db import async_session
+from src.models import BlockedAccessToken
+
+__all__ = ("RevokedTokensFilter", "get_revoked_tokens_filter", "run_revoked_tokens_compaction")
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+RELOAD_BATCH_SIZE = 10000
+PURGE_LOCK_KEY = "revoked-tokens:purge:lock"
+
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора
+_background_tasks = set()
+
+
+class RevokedTokensFilter:
+    """Фильтр Блума отозванных jti в памяти воркера.
+
+    Если jti нет в фильтре, токен точно не отозван и ходить в Redis и
+    Postgres не нужно. Пока фильтр не загружен из Postgres (при старте и
+    после переподключения к pub/sub), он отвечает "возможно отозван" на
+    любой jti, и проверка идет в основные хранилища.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.ready = False
+        self._filter = BloomFilter(capacity, error_rate)
+        # Фильтры, которые сейчас собираются из Postgres
+        self._loading: List[BloomFilter] = []
+
+    def might_be_revoked(self, jti: str) -> bool:
+        if not self.ready:
+            REVOCATION_FILTER_CHECKS.labels("not_ready").inc()
+            return True
+        if jti in self._filter:
+            REVOCATION_FILTER_CHECKS.labels("positive").inc()
+            return True
+        REVOCATION_FILTER_CHECKS.labels("negative").inc()
+        return False
+
+    def add(self, jti: str):
+        self._filter.add(jti)
+        # jti, отозванные во время перезагрузки, не должны потеряться
+        for loading in self._loading:
+            loading.add(jti)
+
+    async def reload(self, reset: bool = True):
+        """Собрать фильтр заново из таблицы отозванных токенов.
+
+        С reset=False текущий фильтр продолжает отвечать, пока собирается
+        новый: так фильтр периодически избавляется от истекших jti.
+        """
+        if reset:
+            self.ready = False
+        loading = BloomFilter(self.capacity, self.error_rate)
+        self._loading.append(loading)
+        try:
+            async with async_session() as session:
+                result = await session.stream(
+                    select(BlockedAccessToken.jti).where(BlockedAccessToken.exp >= datetime.utcnow())
+                )
+                async for rows in result.partitions(RELOAD_BATCH_SIZE):
+                    for (jti,) in rows:
+                        loading.add(jti)
+            self._filter = loading
+            self.ready = True
+            if self._filter.count > self.capacity:
+                logger.warning(
+                    'Revoked tokens filter holds %s jti, more than its capacity %s',
+                    self._filter.count, self.capacity,
+                )
+            logger.debug('Revoked tokens filter loaded: %s jti.', self._filter.count)
+        finally:
+            self._loading.remove(loading)
+
+    def schedule_reload(self):
+        task = asyncio.create_task(self.reload())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+        task.add_done_callback(_log_reload_failure)
+
+
+def _log_reload_failure(task: asyncio.Task):
+    # Без загруженного фильтра каждый токен проверяется по кэшу и базе
+    if not task.cancelled() and (error := task.exception()) is not None:
+        logger.error('Revoked tokens filter reload failed', exc_info=error)
+
+
+async def purge_expired_revoked_tokens(batch_size: int) -> int:
+    """Удалить истекшие отозванные токены пачками по batch_size строк."""
+    purged = 0
+    async with async_session() as session:
+        while True:
+            expired_ids = (
+                select(BlockedAccessToken.id)
+                .where(BlockedAccessToken.exp < datetime.utcnow())
+                .limit(batch_size)
+                .scalar_subquery()
+            )
+            result = await session.execute(delete(BlockedAccessToken).where(BlockedAccessToken.id.in_(expired_ids)))
+            await session.commit()
+            purged += result.rowcount
+            if result.rowcount < batch_size:
+                return purged
+
+
+async def run_revoked_tokens_compaction(cache: AbstractCache, interval: int, batch_size: int):
+    """Периодически чистить таблицу отозванных токенов и фильтр воркера.
+
+    Удаление строк выполняет один воркер за интервал (блокировка в Redis),
+    фильтр пересобирает каждый воркер.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if await cache.cache.set(PURGE_LOCK_KEY, 1, nx=True, ex=interval):
+                purged = await purge_expired_revoked_tokens(batch_size)
+                REVOKED_TOKENS_PURGED.inc(purged)
+                logger.debug('Purged %s expired revoked tokens.', purged)
+            if revoked_tokens_filter is not None and revoked_tokens_filter.ready:
+                await revoked_tokens_filter.reload(reset=False)
+        except Exception:
+            logger.exception('Revoked tokens compaction failed')
+
+
+revoked_tokens_filter: Optional[RevokedTokensFilter] = None
+
+
+def get_revoked_tokens_filter() -> Optional[RevokedTokensFilter]:
+    return revoked_tokens_filter
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Dict, NamedTuple, Optional
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from jwt.utils import base64url_encode
+from sqlalchemy import delete, func
+from sqlmodel import select
+
+from src.db.db import async_session
+from src.models import JwtSigningKey
+
+__all__ = ("SigningKey", "KeyRing", "get_key_ring", "run_key_rotation")
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Ротацию выполняет один воркер: транзакция с advisory-блокировкой Postgres
+ROTATION_LOCK_ID = 0x6A776B73  # "jwks"
+ROTATION_WAIT_SECONDS = 0.5
+
+
+class SigningKey(NamedTuple):
+    kid: str
+    created_at: float
+    private_key: object
+    public_key: object
+
+
+def _generate_private_key(algorithm: str):
+    if algorithm == "ES256":
+        return ec.generate_private_key(ec.SECP256R1())
+    if algorithm == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    raise ValueError(f"Unsupported JWT algorithm for key rotation: {algorithm}")
+
+
+def _to_jwk(key: SigningKey, algorithm: str) -> dict:
+    if algorithm == "ES256":
+        numbers = key.public_key.public_numbers()
+        return {
+            "kty": "EC",
+            "crv": "P-256",
+            "x": base64url_encode(numbers.x.to_bytes(32, "big")).decode(),
+            "y": base64url_encode(numbers.y.to_bytes(32, "big")).decode(),
+            "kid": key.kid,
+            "alg": algorithm,
+            "use": "sig",
+        }
+    raw = key.public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    return {
+        "kty": "OKP",
+        "crv": "Ed25519",
+        "x": base64url_encode(raw).decode(),
+        "kid": key.kid,
+        "alg": algorithm,
+        "use": "sig",
+    }
+
+
+class KeyRing:
+    """Ключи подписи JWT, общие для всех воркеров через Postgres.
+
+    Закрытые ключи хранятся в таблице jwtsigningkey зашифрованными
+    encryption_key: без него содержимое таблицы не позволяет подписать
+    токен. В отличие от кэша Redis, таблица не теряет ключи при вытеснении.
+    Новый ключ сначала только публикуется в JWKS и начинает подписывать
+    токены через activation_delay: к этому времени его успевают загрузить
+    все воркеры и сторонние сервисы с закэшированным JWKS. Старый ключ
+    остается в JWKS, пока не истекут все подписанные им токены.
+    """
+
+    def __init__(
+        self,
+        algorithm: str,
+        encryption_key: str,
+        rotation_interval: int,
+        activation_delay: int,
+        retention: int,
+    ):
+        if not encryption_key:
+            raise ValueError(f"JWT_KEYS_ENCRYPTION_KEY is required for {algorithm}")
+        self.algorithm = algorithm
+        self.encryption_key = encryption_key.encode()
+        self.rotation_interval = rotation_interval
+        self.activation_delay = activation_delay
+        self.retention = retention
+        self._keys: Dict[str, SigningKey] = {}
+
+    async def load(self):
+        async with async_session() as session:
+            records = (await session.exec(select(JwtSigningKey))).all()
+        keys = {}
+        for record in records:
+            # Расшифровываем только новые ключи, уже загруженные берем как есть
+            key = self._keys.get(record.kid)
+            if key is None:
+                private_key = serialization.load_pem_private_key(
+                    record.private_key.encode(), password=self.encryption_key,
+                )
+                key = SigningKey(
+                    kid=record.kid,
+                    created_at=record.created_at,
+                    private_key=private_key,
+                    public_key=private_key.public_key(),
+                )
+            keys[record.kid] = key
+        self._keys = keys
+
+    async def ensure_signing_key(self):
+        """Дождаться, пока в базе появится хотя бы один ключ (его создает один из воркеров)."""
+        await self.load()
+        while True:
+            await self.rotate_if_needed()
+            if self._keys:
+                return
+            await asyncio.sleep(ROTATION_WAIT_SECONDS)
+            await self.load()
+
+    async def rotate_if_needed(self):
+        """Создать новый ключ, если текущий старше rotation_interval, и удалить отслужившие."""
+        now = time.time()
+        newest = max(self._keys.values(), key=lambda key: key.created_at, default=None)
+        if newest is not None and newest.created_at + self.rotation_interval > now:
+            return
+        async with async_session() as session:
+            # Блокировка снимается вместе с транзакцией, даже если воркер упал
+            if not await session.scalar(func.pg_try_advisory_xact_lock(ROTATION_LOCK_ID).select()):
+                return
+            records = (await session.exec(select(JwtSigningKey))).all()
+            newest = max(records, key=lambda record: record.created_at, default=None)
+            if newest is None or newest.created_at + self.rotation_interval <= now:
+                private_key = _generate_private_key(self.algorithm)
+                kid = uuid.uuid4().hex
+                pem = private_key.private_bytes(
+                    serialization.Encoding.PEM,
+                    serialization.PrivateFormat.PKCS8,
+                    serialization.BestAvailableEncryption(self.encryption_key),
+                )
+                # Самый первый ключ подписывает сразу: других ключей еще нет
+                created_at = now if newest is not None else now - self.activation_delay
+                session.add(JwtSigningKey(kid=kid, created_at=created_at, private_key=pem.decode()))
+                logger.info('New JWT signing key %s created.', kid)
+            retired = [
+                record.kid for record in records
+                if record.created_at + self.rotation_interval + self.activation_delay + self.retention < now
+            ]
+            if retired:
+                await session.execute(delete(JwtSigningKey).where(JwtSigningKey.kid.in_(retired)))
+            await session.commit()
+        await self.load()
+
+    def signing_key(self) -> SigningKey:
+        """Самый новый ключ, который уже можно использовать для подписи."""
+        activated_before = time.time() - self.activation_delay
+        active = [key for key in self._keys.values() if key.created_at <= activated_before]
+        return max(active or self._keys.values(), key=lambda key: key.created_at)
+
+    def public_key(self, kid: Optional[str]):
+        key = self._keys.get(kid)
+        return key.public_key if key is not None else None
+
+    def jwks(self) -> dict:
+        return {"keys": [_to_jwk(key, self.algorithm) for key in self._keys.values()]}
+
+
+async def run_key_rotation(key_ring: KeyRing, interval: int):
+    """Периодически подтягивать ключи из базы и ротировать их по расписанию."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await key_ring.rotate_if_needed()
+            await key_ring.load()
+        except Exception:
+            logger.exception('JWT key rotation failed')
+
+
+key_ring: Optional[KeyRing] = None
+
+
+def get_key_ring() -> Optional[KeyRing]:
+    return key_ring
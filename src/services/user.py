@@ -1,23 +1,35 @@
+import hashlib
 import json
 import re
 import logging
+import time
+from datetime import datetime
 from functools import lru_cache
-from typing import Any, Union, Tuple
+from typing import Any, List, Optional, Set, Union, Tuple
 import uuid
 
-from fastapi import Depends, status
+import orjson
+from fastapi import Depends, Security, status
 from fastapi.exceptions import HTTPException
-from sqlmodel import Session
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.api.v1.schemas import UserCreate, UserModel
 from src.api.v1.schemas.users import TokenPayload, Tokens
-from src.db import AbstractCache, get_cache, get_session, get_blocked_access_tokens_cache, get_active_refresh_tokens_cache
+from src.core import config
+from src.db import AbstractCache, LocalCache, RefreshTokenRegistry, get_cache, get_session, get_blocked_access_tokens_cache, get_local_user_cache, get_refresh_token_registry
 from src.models import User, BlockedAccessToken
 from src.services import ServiceMixin
 from src.services.auth import Auth
+from src.services.revocation import RevokedTokensFilter, get_revoked_tokens_filter
 
-__all__ = ("UserService", "get_user_service")
+__all__ = ("UserService", "get_user_service", "get_token_claims", "forget_local_user", "user_etag")
 auth_handler = Auth()
+# Без заголовка — 401, как раньше с OAuth2PasswordBearer (HTTPBearer сам отвечает 403)
+security = HTTPBearer(auto_error=False)
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -26,17 +38,46 @@ logger = logging.getLogger(__name__)
 EMAIL_RE = '^[A-Za-z0-9]+[\._]?[A-Za-z0-9]+[@]\w+[.]\w{2,3}$'
 
 
+def user_response_key(user_key: str) -> str:
+    """Ключ готового JSON ответа /users/me для пользователя user_key."""
+    return f"{user_key}:response"
+
+
+def user_version_key(user_key: str) -> str:
+    """Ключ версии профиля: увеличивается при каждом изменении пользователя."""
+    return f"{user_key}:version"
+
+
+def user_etag(username: str, version: int) -> str:
+    # Имя может содержать кавычки и не-latin-1 символы, в заголовок идет только хеш
+    user = hashlib.blake2b(username.encode(), digest_size=8).hexdigest()
+    return f'"user-{user}-{version}"'
+
+
+def forget_local_user(user_key: str):
+    """Удалить пользователя, его готовый ответ и версию из кэша в памяти воркера."""
+    local_user_cache = get_local_user_cache()
+    if local_user_cache is not None:
+        local_user_cache.delete(user_key)
+        local_user_cache.delete(user_response_key(user_key))
+        local_user_cache.delete(user_version_key(user_key))
+
+
 class UserService(ServiceMixin):
     def __init__(
                 self, 
                 cache: AbstractCache, 
-                session: Session,
+                session: AsyncSession,
                 blocked_access_tokens_cache: AbstractCache=None,
-                active_refresh_tokens_cache: AbstractCache=None,
+                refresh_token_registry: RefreshTokenRegistry=None,
+                local_user_cache: Optional[LocalCache]=None,
+                revoked_tokens_filter: Optional[RevokedTokensFilter]=None,
             ):
             super().__init__(cache=cache, session=session)
             self.blocked_access_tokens_cache = blocked_access_tokens_cache
-            self.active_refresh_tokens_cache = active_refresh_tokens_cache
+            self.refresh_token_registry = refresh_token_registry
+            self.local_user_cache = local_user_cache
+            self.revoked_tokens_filter = revoked_tokens_filter
 
     def check_email(self, email: str) -> bool:
         logger.debug(email)
@@ -51,167 +92,272 @@ class UserService(ServiceMixin):
             user_no_password_field['created_at'] = user_no_password_field['created_at'].strftime('%Y-%m-%dT%H:%M:%S')
         return user_no_password_field
 
-    def signup(self, user_details: UserCreate) -> dict:
-        if self.session.query(User).filter(User.username==user_details.username).all():
-            raise HTTPException(status_code=409, detail='Account with such username already exists')
-        if self.session.query(User).filter(User.email==user_details.email).all():
-            raise HTTPException(status_code=409, detail='Account with such email already exists')
+    async def signup(self, user_details: UserCreate) -> dict:
         if not self.check_email(user_details.email):
             raise HTTPException(status_code=409, detail='Email is not correct!')
+        hashed_password = await auth_handler.encode_password(user_details.password)
+        new_user_dict = {
+            'username': user_details.username,
+            'email': user_details.email,
+            'password': hashed_password,
+            'uuid': str(uuid.uuid4()),
+            # Массив в формате Postgres, как его хранит колонка roles
+            'roles': '{common_user,special_guest}',
+            'created_at': datetime.utcnow(),
+            'is_totp_enabled': False,
+            'is_active': True,
+        }
+        # Занятые имя или email проверяет уникальный индекс в том же запросе
+        statement = insert(User).values(**new_user_dict).on_conflict_do_nothing().returning(User.id)
         try:
-            hashed_password = auth_handler.encode_password(user_details.password)
-            new_user = User(username=user_details.username, 
-                        email=user_details.email, 
-                        password=hashed_password,
-                        uuid=str(uuid.uuid4()),
-                        roles=['common_user', 'special_guest'])
-            logger.debug(new_user.roles)
-            self.session.add(new_user)
-            self.session.commit()
-            self.session.refresh(new_user)
-
-            new_user_dict = new_user.dict()
-            new_user_dict['created_at'] = new_user_dict['created_at'].strftime('%Y-%m-%dT%H:%M:%S')
-            self.cache.set(key=f"user:{new_user.username}", value=json.dumps(new_user_dict))
-            logger.debug('User saved to redis cache')
-
-            return new_user_dict
+            user_id = (await self.session.execute(statement)).scalar_one_or_none()
+            await self.session.commit()
         except:
             raise HTTPException(status_code=500, detail='Can\'t add user to database.')
+        if user_id is None:
+            # Конфликт: один запрос по индексу, чтобы выбрать сообщение
+            if (await self.session.exec(select(User.id).where(User.username==user_details.username))).first():
+                raise HTTPException(status_code=409, detail='Account with such username already exists')
+            raise HTTPException(status_code=409, detail='Account with such email already exists')
 
-    def login(self, user_details: UserCreate) -> dict:
-        user = self.session.query(User).filter(User.username==user_details.username).one_or_none()
+        new_user_dict['id'] = user_id
+        new_user_dict['roles'] = ['common_user', 'special_guest']
+        new_user_dict['created_at'] = new_user_dict['created_at'].strftime('%Y-%m-%dT%H:%M:%S')
+        await self.cache.set(key=f"user:{user_details.username}", value=json.dumps(new_user_dict))
+        # Имя могло принадлежать пользователю, сменившему его: старые ETag не должны совпасть
+        await self.cache.cache.incr(user_version_key(f"user:{user_details.username}"))
+        logger.debug('User saved to redis cache')
+        await self.invalidate_local_user_cache(f"user:{user_details.username}")
+        return new_user_dict
+
+    async def login(self, user_details: UserCreate) -> dict:
+        user = (await self.session.exec(select(User).where(User.username==user_details.username))).one_or_none()
         if user is None:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Incorrect username')
 
-        if not auth_handler.verify_password(user_details.password, user.password):
+        if not await auth_handler.verify_password(user_details.password, user.password):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Incorrect password')
 
         access_token = auth_handler.encode_token(user.username)
-        refresh_token = auth_handler.encode_refresh_token(user.username)
-        self.add_refresh_token_to_cache(refresh_token)
+        refresh_token, refresh_payload = auth_handler.new_refresh_token(user.username)
+        await self.add_refresh_token_to_cache(refresh_payload)
 
         return {'access_token': access_token, 'refresh_token': refresh_token}
 
-    def get_current_user(self, token: str) -> UserModel:
-        payload = auth_handler.decode_token(token)
-        logger.debug(payload['scope'])
-        token_data = TokenPayload(**payload)
+    async def get_current_user(self, token_data: TokenPayload) -> UserModel:
+        user_key = f"user:{token_data.sub}"
+        if self.local_user_cache is not None and (local_user := self.local_user_cache.get(user_key)):
+            return local_user
 
-        if cached_user := self.cache.get(key=f"user:{token_data.sub}"):
+        if cached_user := await self.cache.get(key=user_key):
             logger.debug('Load user from redis cache.')
             user_no_password_field = self.get_user_dict(json.loads(cached_user).items())
-            return UserModel(**user_no_password_field)
+            return self.remember_user(user_key, UserModel(**user_no_password_field))
 
-        user: Union[dict[str, Any], None] = self.session.query(User).filter(User.username==token_data.sub).one_or_none()
+        user: Union[dict[str, Any], None] = (await self.session.exec(select(User).where(User.username==token_data.sub))).one_or_none()
 
         if user is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Could not find user") 
 
         user_no_password_field = self.get_user_dict(user)
         logger.debug(user_no_password_field['roles'])
-        return UserModel(**user_no_password_field)
-
-    def refresh_tokens(self, refresh_token) -> Tokens:
-        if not self.check_if_refresh_token_is_active_in_cache(refresh_token=refresh_token):
+        return self.remember_user(user_key, UserModel(**user_no_password_field))
+
+    async def get_user_version(self, username: str) -> int:
+        version_key = user_version_key(f"user:{username}")
+        if self.local_user_cache is not None and (version := self.local_user_cache.get(version_key)) is not None:
+            return version
+        version = int(await self.cache.cache.get(version_key) or 0)
+        if self.local_user_cache is not None:
+            self.local_user_cache.set(version_key, version)
+        return version
+
+    async def get_me_response(self, token_data: TokenPayload) -> bytes:
+        """Готовый JSON профиля; UserModel собирается только при промахе кэшей."""
+        response_key = user_response_key(f"user:{token_data.sub}")
+        if self.local_user_cache is not None and (local_response := self.local_user_cache.get(response_key)):
+            return local_response
+        if not (response := await self.cache.get(key=response_key)):
+            user = await self.get_current_user(token_data)
+            response = orjson.dumps(user.dict())
+            await self.cache.set(key=response_key, value=response)
+        if self.local_user_cache is not None:
+            self.local_user_cache.set(response_key, response)
+        return response
+
+    def remember_user(self, user_key: str, user: UserModel) -> UserModel:
+        if self.local_user_cache is not None:
+            self.local_user_cache.set(user_key, user)
+        return user
+
+    async def invalidate_local_user_cache(self, *user_keys: str):
+        """Сбросить пользователей из кэша в памяти во всех воркерах."""
+        for user_key in user_keys:
+            forget_local_user(user_key)
+            await self.cache.cache.publish(config.USER_CACHE_INVALIDATION_CHANNEL, user_key)
+
+    async def refresh_tokens(self, refresh_token) -> Tokens:
+        payload = auth_handler.decode_refresh_token(refresh_token)
+        username = payload['sub']
+        new_refresh_token, new_payload = auth_handler.new_refresh_token(username)
+        # Старый токен погашается и заменяется новым одной атомарной операцией
+        if not await self.refresh_token_registry.rotate(
+                username, old_jti=payload['jti'], new_jti=new_payload['jti'], new_exp=new_payload['exp']):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Current refresh token is no longer active.')
-        new_refresh_token = auth_handler.update_refresh_token(refresh_token)
-        self.add_refresh_token_to_cache(new_refresh_token)
-        username = auth_handler.decode_refresh_token(refresh_token)['sub']
         new_access_token = auth_handler.encode_token(username=username)
         return Tokens(access_token=new_access_token, refresh_token=new_refresh_token)
 
-    def block_user_token(self, access_token):
-        jti = auth_handler.decode_token(access_token)['jti']
-        if blocked_token := self.blocked_access_tokens_cache.get(key=f"{jti}"):
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='(Redis) Already logged out!')
-
-        already_blocked = self.session.query(BlockedAccessToken).filter(BlockedAccessToken.jti==jti).one_or_none()
-        if already_blocked:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Already logged out!')
-        
+    async def block_user_token(self, token_data: TokenPayload):
+        """Отозвать access-токен. Что он еще не отозван, проверяет get_token_claims."""
+        jti, exp = token_data.jti, token_data.exp.timestamp()
         try:
-            self.blocked_access_tokens_cache.set(key=f"{jti}", value=jti)
-            new_blocked_token = BlockedAccessToken(jti=jti)
+            # Запись в Redis живет ровно до истечения самого токена
+            await self.blocked_access_tokens_cache.set(key=f"{jti}", value=jti, expire=max(int(exp - time.time()), 1))
+            new_blocked_token = BlockedAccessToken(jti=jti, exp=datetime.utcfromtimestamp(exp))
             self.session.add(new_blocked_token)
-            self.session.commit()
-            self.session.refresh(new_blocked_token)
-            return 'Logged out!'
+            await self.session.commit()
+            await self.session.refresh(new_blocked_token)
         except:
             raise HTTPException(status_code=500, detail='Can\'t add access token to database.')
-
-    def check_token_if_blocked(self, access_token):
-        jti = auth_handler.decode_token(access_token)['jti']
-        if blocked_token := self.blocked_access_tokens_cache.get(key=f"{jti}"):
+        if self.revoked_tokens_filter is not None:
+            self.revoked_tokens_filter.add(jti)
+        await self.blocked_access_tokens_cache.cache.publish(config.REVOKED_TOKENS_CHANNEL, jti)
+        return 'Logged out!'
+
+    async def check_token_if_blocked(self, jti: str):
+        # Почти все токены не отозваны: отрицательный ответ фильтра окончателен
+        if self.revoked_tokens_filter is not None and not self.revoked_tokens_filter.might_be_revoked(jti):
+            return False
+        if blocked_token := await self.blocked_access_tokens_cache.get(key=f"{jti}"):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='(Redis) Already logged out!')
         
-        already_blocked = self.session.query(BlockedAccessToken).filter(BlockedAccessToken.jti==jti).one_or_none()
+        already_blocked = (await self.session.exec(select(BlockedAccessToken).where(BlockedAccessToken.jti==jti))).one_or_none()
         if already_blocked:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Already logged out.')
         return False
 
-    def edit_user(self, access_token, new_user_details: UserCreate) -> Tuple[dict, str]:
-        username = auth_handler.decode_token(access_token)['sub']
-        user = self.session.query(User).filter(User.username==username).one_or_none()
+    async def find_blocked_tokens(self, jtis: List[str]) -> Set[str]:
+        """Какие из jti отозваны: один MGET в Redis и один IN (...) в Postgres."""
+        if self.revoked_tokens_filter is not None:
+            jtis = [jti for jti in jtis if self.revoked_tokens_filter.might_be_revoked(jti)]
+        if not jtis:
+            return set()
+        cached = await self.blocked_access_tokens_cache.get_many(jtis)
+        blocked = {jti for jti, value in zip(jtis, cached) if value is not None}
+        missing = [jti for jti in jtis if jti not in blocked]
+        if missing:
+            rows = await self.session.exec(select(BlockedAccessToken.jti).where(BlockedAccessToken.jti.in_(missing)))
+            blocked.update(rows.all())
+        return blocked
+
+    async def introspect_tokens(self, tokens: List[str]) -> List[dict]:
+        results = []
+        claims = {}
+        for index, token in enumerate(tokens):
+            try:
+                claims[index] = auth_handler.decode_token(token)
+                results.append({'active': True})
+            except HTTPException as e:
+                results.append({'active': False, 'detail': e.detail})
+        blocked = await self.find_blocked_tokens(list({payload['jti'] for payload in claims.values()}))
+        for index, payload in claims.items():
+            if payload['jti'] in blocked:
+                results[index] = {'active': False, 'detail': 'Token has been revoked'}
+            else:
+                results[index]['claims'] = TokenPayload(**payload)
+        return results
+
+    async def edit_user(self, token_data: TokenPayload, new_user_details: UserCreate) -> Tuple[dict, str]:
+        username = token_data.sub
+        user = (await self.session.exec(select(User).where(User.username==username))).one_or_none()
         if user is None:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Incorrect user')
         if not self.check_email(new_user_details.email):
             raise HTTPException(status_code=409, detail='Email is not correct!')
+        user_id = user.id
         try:
             user.username = new_user_details.username
             user.email = new_user_details.email
-            self.session.commit()
-            self.session.refresh(user)
+            await self.session.commit()
+            await self.session.refresh(user)
             access_token = auth_handler.encode_token(user.username)
-            refresh_token = auth_handler.encode_refresh_token(user.username)
-            self.add_refresh_token_to_cache(refresh_token)
+            refresh_token, refresh_payload = auth_handler.new_refresh_token(user.username)
+            await self.add_refresh_token_to_cache(refresh_payload)
 
             user_no_password_field = self.get_user_dict(user)
             logger.debug(user_no_password_field)
-            self.cache.set(key=f"user:{user_no_password_field['username']}", value=json.dumps(user_no_password_field))
+            await self.cache.set(key=f"user:{user_no_password_field['username']}", value=json.dumps(user_no_password_field))
             logger.debug('User saved to redis cache')
+            stale_keys = [user_response_key(f"user:{username}"), user_response_key(f"user:{user.username}")]
+            if username != user.username:
+                stale_keys.append(f"user:{username}")
+            async with self.cache.cache.pipeline(transaction=False) as pipe:
+                pipe.delete(*stale_keys)
+                pipe.incr(user_version_key(f"user:{username}"))
+                if username != user.username:
+                    pipe.incr(user_version_key(f"user:{user.username}"))
+                await pipe.execute()
+            await self.invalidate_local_user_cache(f"user:{username}", f"user:{user.username}")
 
             return user_no_password_field, access_token
+        except IntegrityError:
+            await self.session.rollback()
+            # Имя или email уже заняты другим пользователем (уникальные индексы)
+            taken = select(User.id).where(User.username==new_user_details.username, User.id!=user_id)
+            if (await self.session.exec(taken)).first():
+                raise HTTPException(status_code=409, detail='Account with such username already exists')
+            raise HTTPException(status_code=409, detail='Account with such email already exists')
         except Exception as e:
+            await self.session.rollback()
             raise HTTPException(status_code=500, detail='Can\'t edit user in database. {}'.format(e))
 
-    def add_refresh_token_to_cache(self, refresh_token):
-        username = auth_handler.decode_refresh_token(refresh_token)['sub']
-        token_list = []
-        if tokens_json := self.active_refresh_tokens_cache.get(key=f"{username}"):
-            token_list = json.loads(tokens_json)
-        token_list.append(refresh_token)
-        new_tokens_json = json.dumps(token_list)
-        self.active_refresh_tokens_cache.set(key=f"{username}", value=new_tokens_json)
+    async def add_refresh_token_to_cache(self, refresh_payload: dict):
+        await self.refresh_token_registry.add(
+            refresh_payload['sub'], jti=refresh_payload['jti'], exp=refresh_payload['exp']
+        )
         logger.debug('Refresh token was saved to cache. (Redis)')
 
-    def delete_refresh_tokens_from_cache(self, access_token):
-        username = auth_handler.decode_token(access_token)['sub']
-        self.active_refresh_tokens_cache.set(key=f"{username}", value='{}')
+    async def delete_refresh_tokens_from_cache(self, token_data: TokenPayload):
+        await self.refresh_token_registry.revoke_all(token_data.sub)
         logger.debug('All refresh tokens of this user was revoked. (Redis)')
         return 'Logged out from all devices!'
 
-    def check_if_refresh_token_is_active_in_cache(self, refresh_token):
-        username = auth_handler.decode_refresh_token(refresh_token)['sub']
-        token_list = []
-        if tokens_json := self.active_refresh_tokens_cache.get(key=f"{username}"):
-            token_list = json.loads(tokens_json)
-        if refresh_token in token_list:
-            return True
-        return False
-
 
 # get_user_service — это провайдер UserService. Синглтон
 @lru_cache()
 def get_user_service(
     cache: AbstractCache = Depends(get_cache),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
     blocked_access_tokens_cache: AbstractCache = Depends(get_blocked_access_tokens_cache),
-    active_refresh_tokens_cache: AbstractCache = Depends(get_active_refresh_tokens_cache),
+    refresh_token_registry: RefreshTokenRegistry = Depends(get_refresh_token_registry),
+    local_user_cache: Optional[LocalCache] = Depends(get_local_user_cache),
+    revoked_tokens_filter: Optional[RevokedTokensFilter] = Depends(get_revoked_tokens_filter),
 ) -> UserService:
     return UserService(
                 cache = cache,
                 session = session,
                 blocked_access_tokens_cache = blocked_access_tokens_cache,
-                active_refresh_tokens_cache = active_refresh_tokens_cache,
+                refresh_token_registry = refresh_token_registry,
+                local_user_cache = local_user_cache,
+                revoked_tokens_filter = revoked_tokens_filter,
             )
+
+
+async def get_token_claims(
+    credentials: Optional[HTTPAuthorizationCredentials] = Security(security),
+    user_service: UserService = Depends(get_user_service),
+) -> TokenPayload:
+    """Проверить access-токен запроса один раз и отдать его claims.
+
+    FastAPI кэширует результат зависимости в пределах запроса, поэтому
+    токен декодируется и проверяется на отзыв ровно один раз.
+    """
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Not authenticated',
+            headers={'WWW-Authenticate': 'Bearer'},
+        )
+    payload = auth_handler.decode_token(credentials.credentials)
+    await user_service.check_token_if_blocked(payload['jti'])
+    return TokenPayload(**payload)